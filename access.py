@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - devices access index.
+#  Created by LulzLoL231 at 18/10/26
+#
+from functools import lru_cache
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Set, Tuple
+
+import config
+from cache import TTLCache
+from models import User, Device
+
+
+@lru_cache(maxsize=config.ACCESS_GROUP_SETS_MAXSIZE)
+def getGroupSet(groups: Tuple[str, ...]) -> FrozenSet[str]:
+    '''Returns groups set, cached by groups tuple, so it follows membership changes.
+
+    Args:
+        groups (Tuple[str, ...]): user or device groups.
+
+    Returns:
+        FrozenSet[str]: groups.
+    '''
+    return frozenset(groups)
+
+
+class Snapshot:
+    '''Devices list with its own access and groups index.
+
+    Args:
+        array (List[Device]): devices snapshot.
+    '''
+    __slots__ = ('array', 'by_access', 'by_group', 'filtered')
+
+    def __init__(self, array: List[Device]) -> None:
+        self.array = array
+        self.by_access: Dict[str, Set[str]] = {}
+        self.by_group: Dict[str, Set[str]] = {}
+        self.filtered: Dict[str, List[Device]] = {}
+
+
+class AccessIndex:
+    '''Index of devices by network access and groups.
+
+    Index is built once per devices snapshot from its own devices, so lists
+    of different ages never mix. Filtered device lists are computed once
+    per snapshot and user access level, then returned from cache.
+    '''
+    def __init__(self) -> None:
+        self._snapshots = TTLCache('access_snapshots',
+                                   maxsize=config.ACCESS_SNAPSHOTS_MAXSIZE,
+                                   ttl=config.DEVICE_CACHE_TTL)
+
+    def _getSnapshot(self, array: List[Device]) -> Snapshot:
+        entry = self._snapshots.get(id(array))
+        if entry is not None and entry.array is array:
+            return entry
+        entry = Snapshot(array)
+        for device in array:
+            entry.by_access.setdefault(device.network_access, set()).add(device.uuid)
+            for group in device.groups:
+                entry.by_group.setdefault(group, set()).add(device.uuid)
+        self._snapshots.set(id(array), entry)
+        return entry
+
+    def allowedDevices(self, array: List[Device], user_access: str) -> Set[str]:
+        '''Returns UUIDs of devices from array allowed for access level.
+
+        Args:
+            array (List[Device]): devices snapshot.
+            user_access (str): user access level.
+
+        Returns:
+            Set[str]: device UUIDs.
+        '''
+        if user_access == 'admin':
+            return {device.uuid for device in array}
+        return set(self._getSnapshot(array).by_access.get(user_access, ()))
+
+    def devicesInGroups(self, array: List[Device], groups: Iterable[str]) -> Set[str]:
+        '''Returns UUIDs of devices from array in any of groups.
+
+        Args:
+            array (List[Device]): devices snapshot.
+            groups (Iterable[str]): groups.
+
+        Returns:
+            Set[str]: device UUIDs.
+        '''
+        by_group = self._getSnapshot(array).by_group
+        result: Set[str] = set()
+        for group in groups:
+            result |= by_group.get(group, set())
+        return result
+
+    def devicesWithAccess(self, array: List[Device], accesses: Iterable[str]) -> Set[str]:
+        '''Returns UUIDs of devices from array with any of network access classes.
+
+        Unlike allowedDevices, "admin" here is device access class, not user level.
+
+        Args:
+            array (List[Device]): devices snapshot.
+            accesses (Iterable[str]): network access classes.
+
+        Returns:
+            Set[str]: device UUIDs.
+        '''
+        by_access = self._getSnapshot(array).by_access
+        result: Set[str] = set()
+        for value in accesses:
+            result |= by_access.get(value, set())
+        return result
+
+    def filterDevices(self, array: List[Device], user_access: str) -> List[Device]:
+        '''Returns devices from array allowed for access level, in array order.
+
+        Args:
+            array (List[Device]): devices snapshot.
+            user_access (str): user access level.
+
+        Returns:
+            List[Device]: devices.
+        '''
+        entry = self._getSnapshot(array)
+        filtered = entry.filtered.get(user_access)
+        if filtered is None:
+            if user_access == 'admin':
+                filtered = list(array)
+            else:
+                allowed = entry.by_access.get(user_access, set())
+                filtered = [device for device in array if device.uuid in allowed]
+            entry.filtered[user_access] = filtered
+        return filtered
+
+    def getUserGroups(self, user: User) -> FrozenSet[str]:
+        '''Returns user groups set.
+
+        Args:
+            user (User): user.
+
+        Returns:
+            FrozenSet[str]: groups.
+        '''
+        return getGroupSet(user.groups)
+
+    def userInDeviceGroup(self, user: User, device: Device) -> bool:
+        '''Checks if user and device share any group.
+
+        Only groups of passed user and device are used, never indexed ones,
+        so membership changes in Brain apply as soon as objects are refetched.
+
+        Args:
+            user (User): user.
+            device (Device): device.
+
+        Returns:
+            bool: Boolean.
+        '''
+        return not getGroupSet(user.groups).isdisjoint(device.groups)
+
+    def invalidate(self, kind: str, key: Hashable) -> None:
+        '''Brain invalidation hook.
+
+        Args:
+            kind (str): "user" or "device".
+            key (Hashable): telegram id or device UUID.
+        '''
+        if kind == 'device':
+            # frees snapshots of outdated devices lists
+            self._snapshots.clear()
+
+
+index = AccessIndex()
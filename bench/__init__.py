@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - offline benchmarks.
+#  Created by LulzLoL231 at 18/10/26
+#
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - Brain API stand-in for benchmarks.
+#  Created by LulzLoL231 at 18/10/26
+#
+import random
+import asyncio
+from uuid import UUID
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+import codec
+
+
+AUTH_HEADER = 'X-PCON-Secret'
+URLS = {
+    'getDevicesForUser': '/devices/user',
+    'getDevice': '/device',
+    'addTask': '/task',
+    'getServerVersion': '/version/server',
+    'getClientVersion': '/version/client',
+    'flushTasks': '/tasks/flush',
+    'getTasksForDevice': '/tasks',
+    'getUser': '/user',
+    'addUser': '/user/add',
+    'deleteUser': '/user/delete',
+    'getUsers': '/users',
+    'updateDeviceInfo': '/device/update'
+}
+ACCESS = ('user', 'admin', 'guest')
+GROUPS = ('home', 'office', 'lab', 'media')
+
+
+def makeDevice(num: int, rnd: random.Random) -> Dict[str, Any]:
+    '''Returns synthetic device dict.
+    '''
+    return {
+        'uuid': str(UUID(int=rnd.getrandbits(128), version=4)),
+        'type': rnd.choice(('PC', 'PC', 'IOT')),
+        'alias': f'dev{num}' if num % 3 else '',
+        'hostname': f'host-{num}',
+        'status': rnd.choice(('Online', 'Online', 'Offline')),
+        'platform_name': rnd.choice(('win32', 'linux', 'darwin')),
+        'has_proxy': rnd.random() < 0.5,
+        'has_vc': rnd.random() < 0.3,
+        'network_access': rnd.choice(ACCESS),
+        'groups': rnd.sample(GROUPS, 2),
+        'code_version': f'2.{num % 5}.0',
+        'version': 1
+    }
+
+
+def makeUser(id: int, rnd: random.Random) -> Dict[str, Any]:
+    '''Returns synthetic user dict.
+    '''
+    return {
+        'id': id,
+        'username': f'user{id}',
+        'level': 'admin' if id % 50 == 0 else 'user',
+        'groups': rnd.sample(GROUPS, 2)
+    }
+
+
+class BrainStub:
+    '''aiohttp stand-in for Brain API with latency and error profiles.
+
+    Args:
+        devices (int): fleet size.
+        users (int): registered users count, IDs start from `first_user_id`.
+        latency (float): base response latency in seconds.
+        jitter (float): random extra latency in seconds.
+        error_rate (float): share of requests answered with HTTP 500.
+        msgpack (bool): answer with MessagePack, when client accepts it.
+        gzip_min_size (int): gzip responses from this size, when client accepts it.
+    '''
+    def __init__(self, devices: int = 100, users: int = 1000, latency: float = 0.005,
+                 jitter: float = 0.0, error_rate: float = 0.0,
+                 first_user_id: int = 1000, seed: int = 42,
+                 msgpack: bool = True, gzip_min_size: int = 1024) -> None:
+        rnd = random.Random(seed)
+        self.rnd = random.Random(seed + 1)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.msgpack = msgpack
+        self.gzip_min_size = gzip_min_size
+        self.devices: List[Dict[str, Any]] = [makeDevice(i, rnd) for i in range(devices)]
+        self.by_uuid = {d['uuid']: d for d in self.devices}
+        self.users = {i: makeUser(i, rnd) for i in range(first_user_id, first_user_id + users)}
+        self.tasks: Dict[str, List[Dict[str, Any]]] = {}
+        self.task_id = 0
+        self.requests = 0
+        self.unauthorized = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if AUTH_HEADER not in request.headers:
+            self.unauthorized += 1
+            return web.Response(status=401)
+        await asyncio.sleep(self.latency + self.rnd.random() * self.jitter)
+        if self.error_rate and self.rnd.random() < self.error_rate:
+            return web.Response(status=500)
+        raw = await request.read()
+        if not raw:
+            body = {}
+        elif request.content_type in codec.CODECS:
+            body = codec.CODECS[request.content_type].loads(raw)
+        else:
+            body = codec.decodeLegacy(raw)
+        result = self.route(request.path, body)
+        answer_codec = codec.json_codec
+        if self.msgpack and codec.MSGPACK in request.headers.get('Accept', ''):
+            answer_codec = codec.getCodec(codec.MSGPACK)
+        data = answer_codec.dumps(result)
+        response = web.Response(body=data, content_type=answer_codec.content_type,
+                                status=404 if 'error' in result else 200)
+        if len(data) >= self.gzip_min_size:
+            response.enable_compression()
+        return response
+
+    def route(self, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        '''Returns Brain API answer for request path and decoded body.
+        '''
+        if path == URLS['getUser']:
+            if body['id'] in self.users:
+                return {'ok': True, 'user': dict(self.users[body['id']])}
+            return {'ok': False, 'error': 'User not found', 'error_type': 'NotFound'}
+        if path == URLS['getDevicesForUser']:
+            return {'ok': True, 'devices': self.devices}
+        if path == URLS['getDevice']:
+            if body['device_uuid'] in self.by_uuid:
+                return {'ok': True, 'device': self.by_uuid[body['device_uuid']]}
+            return {'ok': False, 'error': 'Device not found', 'error_type': 'NotFound'}
+        if path == URLS['addTask']:
+            self.task_id += 1
+            self.tasks.setdefault(body['device_uuid'], []).append(
+                {'id': self.task_id, 'type': body['type'], 'status': 'pending',
+                 'repeat': body.get('repeat', 1)})
+            return {'ok': True, 'id': self.task_id}
+        if path == URLS['getTasksForDevice']:
+            tasks = self.tasks.get(body['device_uuid'], [])
+            for task in tasks:
+                task['status'] = 'done'
+            return {'ok': True, 'tasks': tasks}
+        if path == URLS['flushTasks']:
+            self.tasks.pop(body['device_uuid'], None)
+            return {'ok': True}
+        if path in (URLS['getServerVersion'], URLS['getClientVersion']):
+            return {'ok': True, 'version': '2.2.0'}
+        if path == URLS['getUsers']:
+            return {'ok': True, 'users': list(self.users.values())}
+        if path == URLS['addUser']:
+            self.users[body['id']] = {'id': body['id'], 'username': body['username'],
+                                      'level': body['level'], 'groups': []}
+            return {'ok': True}
+        if path == URLS['deleteUser']:
+            self.users.pop(body['id'], None)
+            return {'ok': True}
+        if path == URLS['updateDeviceInfo']:
+            device = self.by_uuid.get(body['device_uuid'])
+            if device is None:
+                return {'ok': False, 'error': 'Device not found', 'error_type': 'NotFound'}
+            device.update(body['updates'])
+            device['version'] += 1
+            return {'ok': True}
+        return {'ok': False, 'error': 'Unknown method', 'error_type': 'BadRequest'}
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        '''Starts stub server.
+
+        Returns:
+            str: stub base url.
+        '''
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f'http://{host}:{port}'
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - stand-in handlers for benchmarks.
+#  Created by LulzLoL231 at 18/10/26
+#
+from aiogram import Dispatcher, types
+
+import utils
+import commands
+import fleet  # noqa: F401 registers bulk tasks handlers.
+import watcher  # noqa: F401 registers watch command handler.
+import controls  # noqa: F401 registers device and user control handlers.
+import security as sec
+from runtime import brain
+from keyboards import Keyboards
+
+
+async def startCmd(msg: types.Message) -> None:
+    user = await sec.getUser(msg)
+    if user:
+        await msg.answer('Hello!', reply_markup=Keyboards(user).start())
+
+
+@commands.router.register('devices')
+async def devicesCmd(msg: types.Message) -> None:
+    user = await sec.getUser(msg)
+    if user:
+        devices = await brain.getDevicesForUser(user.id) or []
+        devices = utils.parseDevicesForUser(devices, user.level)
+        cnt, key = utils.parseDevices(devices)
+        await msg.answer(cnt, reply_markup=key)
+
+
+def register(dp: Dispatcher) -> None:
+    '''Registers stand-in handlers, used when real handlers are not available.
+    '''
+    dp.register_message_handler(startCmd, commands=['start'])
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - micro benchmarks.
+#  Created by LulzLoL231 at 18/10/26
+#
+import random
+import gzip
+import asyncio
+import logging
+import tracemalloc
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+
+import aiohttp
+
+from bench.brain_stub import BrainStub, AUTH_HEADER, URLS, makeDevice, makeUser
+from models import User, Device
+
+
+def makeUserModel(id: int) -> User:
+    return User.fromDict(makeUser(id, random.Random(id)), fetched=None)
+
+
+def perOp(fn: Callable[[], Any], number: int, setup: Callable[[], Any] = None) -> float:
+    '''Returns microseconds per call of fn.
+    '''
+    total = 0.0
+    for _ in range(number):
+        if setup is not None:
+            setup()
+        started = perf_counter()
+        fn()
+        total += perf_counter() - started
+    return round(total / number * 1e6, 3)
+
+
+def keyboards(devices: List[Device]) -> Dict[str, Any]:
+    import keyboards as kb
+    kbd = kb.Keyboards(makeUserModel(50))
+    user = makeUserModel(1)
+    device = devices[0]
+    return {
+        'controlDevice_cold_us': perOp(lambda: kbd.controlDevice(device), 500, kb._markups.clear),
+        'controlDevice_warm_us': perOp(lambda: kbd.controlDevice(device), 5000),
+        'new_Keyboards_us': perOp(lambda: kb.Keyboards(user), 5000)
+    }
+
+
+def callbacks(devices: List[Device]) -> Dict[str, Any]:
+    import callback_data as cbd
+    uuid = devices[0].uuid
+    data = cbd.encode('media_vol_up', uuid)
+
+    def dispatch() -> None:
+        code, _ = cbd._decode(data)
+        cbd.router._handlers[code]
+
+    return {
+        'size_bytes': len(data),
+        'encode_us': perOp(lambda: cbd.encode('media_vol_up', uuid), 5000),
+        'decode_cold_us': perOp(lambda: cbd.decode(data), 2000, cbd._decoded.clear),
+        'decode_warm_us': perOp(lambda: cbd.decode(data), 5000),
+        'dispatch_us': perOp(dispatch, 5000)
+    }
+
+
+def textCommands() -> Dict[str, Any]:
+    '''Measures command lookup, aliases are checked by tests/test_commands.py.
+    '''
+    import commands
+
+    def sequential(text: str) -> str:
+        # previous check_cmd: alias dict rebuilt per call, one call per command
+        for cmd in ('help', 'hubs', 'netstatus', 'devices', 'version', 'users'):
+            cmds = {
+                'help': ('помощь', 'хелп', 'хэлп'),
+                'hubs': ('хабы'),
+                'netstatus': ('статус сети', 'сеть'),
+                'devices': ('устройства'),
+                'version': ('ver', 'version', 'вер', 'версия'),
+                'users': ('usr', 'users', 'пользователи', 'юзеры')
+            }
+            if text.lower() in cmds[cmd]:
+                return cmd
+
+    return {
+        'aliases': len(commands.ALIASES),
+        'sequential_last_us': perOp(lambda: sequential('Юзеры'), 5000),
+        'sequential_miss_us': perOp(lambda: sequential('привет'), 5000),
+        'lookup_us': perOp(lambda: commands.getCommand('Юзеры'), 5000),
+        'lookup_miss_us': perOp(lambda: commands.getCommand('привет'), 5000)
+    }
+
+
+def signing(devices: List[Device]) -> Dict[str, Any]:
+    import security as sec
+    import utils
+    rows = [f'action{i}@{devices[0].uuid}' for i in range(15)]
+    signed = sec.signData(rows[0])
+    device_list = (devices * 100)[:100]
+    return {
+        'signData_15_us': perOp(lambda: [sec.signData(r) for r in rows], 2000),
+        'verifySign_cold_us': perOp(lambda: sec.verifySign(signed), 2000, sec._verified.clear),
+        'verifySign_warm_us': perOp(lambda: sec.verifySign(signed), 5000),
+        'parseDevices_100_rows_us': perOp(
+            lambda: utils.parseDevices(device_list, page_size=100), 200)
+    }
+
+
+def logs(devices: List[Device]) -> Dict[str, Any]:
+    log = logging.getLogger('PCON Bench::logs')
+    log.setLevel(logging.INFO)
+    device = devices[0]
+    return {
+        'eager_fstring_debug_us': perOp(lambda: log.debug(f'Called with device: {str(device)}'), 5000),
+        'lazy_debug_us': perOp(lambda: log.debug('Called with device: %s', device), 5000)
+    }
+
+
+async def fsm() -> Dict[str, Any]:
+    import tempfile
+    import os
+    from aiogram.contrib.fsm_storage.memory import MemoryStorage
+    from fsm_storage import SQLiteStorage
+    results = {}
+    for name, storage in (('memory', MemoryStorage()),
+                          ('sqlite', SQLiteStorage(os.path.join(tempfile.mkdtemp(), 'b.sqlite3')))):
+        started = perf_counter()
+        for i in range(2000):
+            await storage.set_state(chat=i % 200, user=i % 200, state=f'state{i}')
+            await storage.get_state(chat=i % 200, user=i % 200)
+        await storage.close()
+        await storage.wait_closed()
+        results[f'{name}_ops_per_s'] = round(4000 / (perf_counter() - started), 1)
+    return results
+
+
+async def session(base_url: str, requests: int = 500, concurrency: int = 50) -> Dict[str, Any]:
+    from base64 import b64encode
+    from brain_api import Brain
+    from bench.run import percentile
+    url = URLS['getServerVersion']
+    bodies = [b64encode(str(i).encode()) for i in range(requests)]
+    results = {}
+
+    async def measure(call: Callable[[bytes], Any]) -> Dict[str, float]:
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+
+        async def one(body: bytes) -> None:
+            async with semaphore:
+                begin = perf_counter()
+                await call(body)
+                latencies.append(perf_counter() - begin)
+
+        started = perf_counter()
+        await asyncio.gather(*(one(b) for b in bodies))
+        return {'rps': round(requests / (perf_counter() - started), 1),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 3)}
+
+    brain = Brain()
+    brain.endpoint = base_url
+
+    async def perCall(body: bytes) -> None:
+        async with aiohttp.request('GET', base_url + url, data=body,
+                                   headers={AUTH_HEADER: brain.SECRET}) as resp:
+            await resp.json()
+
+    results['per_call'] = await measure(perCall)
+    results['pooled'] = await measure(
+        lambda body: brain._makeAttempts('GET', url, body, 'getServerVersion', False))
+    await brain.close()
+    return results
+
+
+def renderRows(fleet: List[Device]) -> str:
+    '''Renders all fleet rows into one string.
+    '''
+    import utils
+    return ''.join(row for _, row, _ in utils.iterDeviceRows(fleet, 0, len(fleet)))
+
+
+def accessChecks(fleets: Dict[int, List[Device]]) -> Dict[str, Any]:
+    '''Devices filtering by access level and groups checks.
+    '''
+    import access
+    user = makeUserModel(1)
+    results = {}
+    for n, fleet in fleets.items():
+        index = access.AccessIndex()
+        results[str(n)] = {
+            'filter_cold_us': perOp(lambda: index.filterDevices(fleet, 'user'), 3,
+                                    index._snapshots.clear),
+            'filter_warm_us': perOp(lambda: index.filterDevices(fleet, 'user'), 100),
+            'groups_all_us': perOp(
+                lambda: [index.userInDeviceGroup(user, dev) for dev in fleet], 3)
+        }
+    return results
+
+
+def modelsMemory(devices: int = 50000, users: int = 10000) -> Dict[str, Any]:
+    '''Compares memory of raw API dicts and models held in Brain caches.
+    '''
+    from cache import TTLCache
+    rnd = random.Random(3)
+    raw_devices = [makeDevice(i, rnd) for i in range(devices)]
+    raw_users = [dict(makeUser(i, rnd), fetched=None) for i in range(users)]
+
+    def measure(build_device: Callable[[dict], Any], build_user: Callable[[dict], Any]) -> int:
+        device_cache = TTLCache('bench_devices', maxsize=devices, ttl=3600)
+        user_cache = TTLCache('bench_users', maxsize=users, ttl=3600)
+        tracemalloc.start()
+        for device in raw_devices:
+            device_cache.set(device['uuid'], build_device(device))
+        for user in raw_users:
+            user_cache.set(user['id'], build_user(user))
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return current // 1024
+
+    dicts_kb = measure(lambda d: dict(d, groups=list(d['groups'])), dict)
+    models_kb = measure(Device.fromDict, User.fromDict)
+    return {
+        'devices': devices,
+        'users': users,
+        'dicts_kb': dicts_kb,
+        'models_kb': models_kb,
+        'saved_pct': round((1 - models_kb / dicts_kb) * 100, 1) if dicts_kb else 0
+    }
+
+
+def codecs(devices: int = 1000, users: int = 10000) -> Dict[str, Any]:
+    '''Compares Brain codecs on getDevicesForUser and getUsers payloads.
+    '''
+    import json
+    from base64 import b64encode
+    import codec
+    rnd = random.Random(4)
+    payloads = {
+        'getDevicesForUser': {'ok': True, 'devices': [makeDevice(i, rnd) for i in range(devices)]},
+        'getUsers': {'ok': True, 'users': [makeUser(i, rnd) for i in range(users)]}
+    }
+    available = [codec.StdJSONCodec()]
+    if codec.orjson is not None:
+        available.append(codec.OrJSONCodec())
+    if codec.msgpack is not None:
+        available.append(codec.MsgPackCodec())
+    results: Dict[str, Any] = {}
+    for name, payload in payloads.items():
+        results[name] = {}
+        for item in available:
+            data = item.dumps(payload)
+            zipped = gzip.compress(data, compresslevel=5)
+            results[name][item.name] = {
+                'bytes': len(data),
+                'gzip_bytes': len(zipped),
+                'dumps_us': perOp(lambda: item.dumps(payload), 5),
+                'loads_us': perOp(lambda: item.loads(data), 5),
+                'gunzip_loads_us': perOp(lambda: item.loads(gzip.decompress(zipped)), 5)
+            }
+    request = {'device_uuid': payloads['getDevicesForUser']['devices'][0]['uuid'], 'type': 'lock'}
+    results['request_body'] = {
+        'legacy_us': perOp(lambda: b64encode(json.dumps(request).encode()), 5000),
+        'legacy_codec_us': perOp(lambda: codec.encodeLegacy(request), 5000),
+        'raw_us': perOp(lambda: codec.json_codec.dumps(request), 5000)
+    }
+    return results
+
+
+async def runAll(stub: BrainStub) -> Dict[str, Any]:
+    '''Runs all micro benchmarks.
+    '''
+    import utils
+    rnd = random.Random(1)
+    devices = [Device.fromDict(d) for d in stub.devices or [makeDevice(0, rnd)]]
+    fleets = {n: [Device.fromDict(makeDevice(i, rnd)) for i in range(n)] for n in (10, 1000, 10000)}
+    results = {
+        'keyboards': keyboards(devices),
+        'callbacks': callbacks(devices),
+        'text_commands': textCommands(),
+        'signing': signing(devices),
+        'logging': logs(devices),
+        'fsm': await fsm(),
+        'parseDevices_page_us': {
+            str(n): perOp(lambda: utils.parseDevices(fleet), 3) for n, fleet in fleets.items()
+        },
+        'render_rows_cold_us': {
+            str(n): perOp(lambda: renderRows(fleet), 3, utils._rows.clear)
+            for n, fleet in fleets.items()
+        },
+        'render_rows_warm_us': {
+            str(n): perOp(lambda: renderRows(fleet), 3) for n, fleet in fleets.items()
+        },
+        'access': accessChecks(fleets),
+        'models_memory': modelsMemory(),
+        'codecs': codecs()
+    }
+    base_url = f'http://127.0.0.1:{stub._runner.addresses[0][1]}'
+    results['brain_session'] = await session(base_url)
+    return results
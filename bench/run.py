@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - end-to-end benchmark runner.
+#  Created by LulzLoL231 at 18/10/26
+#
+#  Usage: python -m bench.run [--users 1000] [--devices 100] [--output results.json]
+#
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from time import perf_counter, strftime
+from typing import Any, Dict, List
+
+from bench.brain_stub import BrainStub, AUTH_HEADER, URLS
+from bench.telegram_stub import TelegramStub, makeMessage, makeCallback, dumps
+
+
+def percentile(values: List[float], pct: float) -> float:
+    '''Returns percentile of values, nearest-rank method.
+    '''
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(latencies: List[float], elapsed: float, **extra: Any) -> Dict[str, Any]:
+    '''Returns scenario report.
+    '''
+    report = {
+        'updates': len(latencies),
+        'seconds': round(elapsed, 4),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+    report.update(extra)
+    return report
+
+
+class Bench:
+    '''Runs scenarios against runtime dispatcher with Brain and Bot API stubs.
+    '''
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.telegram = TelegramStub(latency=args.telegram_latency)
+        self.stub = BrainStub(devices=args.devices, users=args.users,
+                              latency=args.latency, jitter=args.jitter,
+                              error_rate=args.error_rate, seed=args.seed)
+        self.loop = asyncio.get_event_loop()
+
+    def setup(self) -> None:
+        '''Starts stubs and imports runtime configured to use them.
+        '''
+        os.environ.setdefault('pcon_TOKEN', '123456:bench-token')
+        # outbox caps every scenario at Bot API rates, hiding other differences
+        os.environ['pcon_OUTBOX'] = '1' if self.args.outbox else '0'
+        # stub supports task repeat count
+        os.environ.setdefault('pcon_BRAIN_TASK_REPEAT', '1')
+        os.environ['pcon_TELEGRAM_API_SERVER'] = self.loop.run_until_complete(self.telegram.start())
+        os.environ.setdefault('pcon_FSM_DB_PATH', os.path.join(tempfile.mkdtemp(), 'fsm.sqlite3'))
+        brain_url = self.loop.run_until_complete(self.stub.start())
+        from aiogram import Bot, Dispatcher
+        import runtime
+        from brain_api import Brain
+        Brain.URLS.update(URLS)
+        Brain.AUTH_HEADER = AUTH_HEADER
+        runtime.brain.endpoint = brain_url
+        self.dp = runtime.bot
+        self.brain = runtime.brain
+        try:
+            import cmds  # noqa: F401 registers real handlers.
+            self.handlers = 'cmds'
+        except ImportError:
+            from bench import handlers
+            handlers.register(self.dp)
+            self.handlers = 'bench.handlers'
+        runtime.registerRouters(self.dp)
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+
+    async def _process(self, update: Dict[str, Any], latencies: List[float]) -> None:
+        from aiogram import types
+        started = perf_counter()
+        await self.dp.process_update(types.Update(**update))
+        latencies.append(perf_counter() - started)
+
+    async def runFlows(self, flows: List[List[Dict[str, Any]]],
+                       concurrency: int) -> Dict[str, Any]:
+        '''Runs flows concurrently, updates of one flow in order.
+        '''
+        import debounce
+        latencies: List[float] = []
+        semaphore = asyncio.Semaphore(concurrency)
+        brain_before = self.stub.requests
+        tg_before = sum(self.telegram.calls.values())
+
+        async def runFlow(flow: List[Dict[str, Any]]) -> None:
+            async with semaphore:
+                for update in flow:
+                    await self._process(update, latencies)
+
+        started = perf_counter()
+        await asyncio.gather(*(runFlow(flow) for flow in flows))
+        await debounce.debouncer.flush()
+        elapsed = perf_counter() - started
+        return summarize(latencies, elapsed,
+                         brain_requests=self.stub.requests - brain_before,
+                         telegram_requests=sum(self.telegram.calls.values()) - tg_before)
+
+    def browsingFlows(self) -> List[List[Dict[str, Any]]]:
+        import callback_data as cbd
+        flows = []
+        for user_id in self.stub.users:
+            device = self.rnd.choice(self.stub.devices)
+            flows.append([
+                makeMessage(user_id, '/start'),
+                makeMessage(user_id, 'Устройства'),
+                makeCallback(user_id, cbd.encode('control', device['uuid']))
+            ])
+        return flows
+
+    def burstFlows(self) -> List[List[Dict[str, Any]]]:
+        import callback_data as cbd
+        users = list(self.stub.users)[:self.args.burst_users]
+        flows = []
+        for user_id in users:
+            device = self.rnd.choice(self.stub.devices)
+            data = cbd.encode('media_vol_up', device['uuid'])
+            flows.extend([makeCallback(user_id, data)] for _ in range(self.args.burst_taps))
+        return flows
+
+    async def ingestPolling(self, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        '''Simulates long polling: batches of 100 updates, one round trip per batch.
+        '''
+        latencies: List[float] = []
+        started = perf_counter()
+        for i in range(0, len(updates), 100):
+            await asyncio.sleep(self.args.poll_rtt)
+            await asyncio.gather(*(self._process(u, latencies) for u in updates[i:i + 100]))
+        return summarize(latencies, perf_counter() - started)
+
+    async def ingestWebhook(self, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        '''Posts updates to webhook server, waits until all are processed.
+        '''
+        import aiohttp
+        from aiohttp import web
+        from webhook import WebhookServer, SECRET_HEADER
+        import config
+        server = WebhookServer(self.dp)
+        app = web.Application()
+        app.router.add_post(config.WEBHOOK_PATH, server.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        url = 'http://127.0.0.1:{}{}'.format(site._server.sockets[0].getsockname()[1],
+                                             config.WEBHOOK_PATH)
+        latencies: List[float] = []
+        semaphore = asyncio.Semaphore(64)
+        async with aiohttp.ClientSession() as session:
+            async def post(update: Dict[str, Any]) -> None:
+                async with semaphore:
+                    begin = perf_counter()
+                    async with session.post(url, data=dumps(update),
+                                            headers={'Content-Type': 'application/json',
+                                                     SECRET_HEADER: server.secret}) as resp:
+                        await resp.read()
+                    latencies.append(perf_counter() - begin)
+            started = perf_counter()
+            await asyncio.gather(*(post(u) for u in updates))
+            while server._tasks:
+                await asyncio.gather(*server._tasks, return_exceptions=True)
+            elapsed = perf_counter() - started
+        await runner.cleanup()
+        return summarize(latencies, elapsed)
+
+    def run(self) -> Dict[str, Any]:
+        self.setup()
+        results: Dict[str, Any] = {
+            'meta': {
+                'time': strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': sys.version.split()[0],
+                'handlers': self.handlers,
+                'args': vars(self.args)
+            },
+            'scenarios': {}
+        }
+        scenarios = results['scenarios']
+        selected = set(self.args.scenarios.split(','))
+        run = self.loop.run_until_complete
+        if self.args.tracemalloc:
+            tracemalloc.start()
+        if 'browsing' in selected:
+            scenarios['browsing_cold'] = run(self.runFlows(self.browsingFlows(), self.args.concurrency))
+            scenarios['browsing_warm'] = run(self.runFlows(self.browsingFlows(), self.args.concurrency))
+        if 'burst' in selected:
+            scenarios['control_burst'] = run(self.runFlows(self.burstFlows(), self.args.concurrency))
+        if 'ingest' in selected:
+            users = list(self.stub.users)
+            scenarios['ingest_polling'] = run(self.ingestPolling(
+                [makeMessage(self.rnd.choice(users), '/start') for _ in range(self.args.ingest)]))
+            scenarios['ingest_webhook'] = run(self.ingestWebhook(
+                [makeMessage(self.rnd.choice(users), '/start') for _ in range(self.args.ingest)]))
+        if self.args.tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            results['meta']['tracemalloc_kb'] = {'current': current // 1024, 'peak': peak // 1024}
+        if 'micro' in selected:
+            from bench import micro
+            results['micro'] = run(micro.runAll(self.stub))
+        results['brain'] = self.brain.getHealth()
+        results['brain']['stub_requests'] = self.stub.requests
+        results['brain']['stub_unauthorized'] = self.stub.unauthorized
+        results['caches'] = self.brain.getCacheStats()
+        run(self.brain.close())
+        run(self.stub.stop())
+        run(self.telegram.stop())
+        return results
+
+
+def parseArgs(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='PCON offline benchmarks.')
+    parser.add_argument('--scenarios', default='browsing,burst,ingest,micro')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.005, help='Brain latency, s.')
+    parser.add_argument('--jitter', type=float, default=0.005, help='Brain latency jitter, s.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Brain HTTP 500 share.')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='Bot API latency, s.')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--burst-users', type=int, default=10)
+    parser.add_argument('--burst-taps', type=int, default=50)
+    parser.add_argument('--ingest', type=int, default=2000, help='Updates for ingest scenarios.')
+    parser.add_argument('--poll-rtt', type=float, default=0.05, help='getUpdates round trip, s.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--tracemalloc', action='store_true')
+    parser.add_argument('--outbox', action='store_true',
+                        help='Queue outbound requests, throughput is capped at Bot API rates.')
+    parser.add_argument('--output', default=None, help='JSON file, defaults to bench_results/<time>.json')
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> None:
+    args = parseArgs(argv)
+    results = Bench(args).run()
+    if results['scenarios'] and (not results['brain']['stub_requests']
+                                 or results['brain']['stub_unauthorized']):
+        sys.exit('Brain stub got no authorized requests, check Brain client configuration.')
+    output = args.output or os.path.join('bench_results', strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False, default=str)
+    print(json.dumps(results['scenarios'], indent=2))
+    print(f'Results saved to {output}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
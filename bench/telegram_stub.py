@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - mocked Telegram Bot API and synthetic updates.
+#  Created by LulzLoL231 at 18/10/26
+#
+import json
+import asyncio
+from time import time
+from itertools import count
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+
+class TelegramStub:
+    '''Mocked Bot API server: accepts every method, echoes sent messages.
+    '''
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self._message_id = count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if request.content_type == 'application/json':
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        if method == 'getMe':
+            result: Any = {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+        elif method in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            result = {
+                'message_id': int(data.get('message_id') or next(self._message_id)),
+                'date': int(time()),
+                'chat': {'id': int(data.get('chat_id', 0)), 'type': 'private'},
+                'text': data.get('text', '')
+            }
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        '''Starts mocked Bot API server.
+
+        Returns:
+            str: base url for config.TELEGRAM_API_SERVER.
+        '''
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f'http://{host}:{port}'
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+_update_id = count(1)
+
+
+def _user(id: int) -> Dict[str, Any]:
+    return {'id': id, 'is_bot': False, 'first_name': f'user{id}', 'username': f'user{id}'}
+
+
+def _message(chat_id: int, text: str, message_id: int = 1) -> Dict[str, Any]:
+    return {
+        'message_id': message_id,
+        'date': int(time()),
+        'chat': {'id': chat_id, 'type': 'private', 'username': f'user{chat_id}'},
+        'from': _user(chat_id),
+        'text': text
+    }
+
+
+def makeMessage(chat_id: int, text: str) -> Dict[str, Any]:
+    '''Returns synthetic message update.
+    '''
+    return {'update_id': next(_update_id), 'message': _message(chat_id, text)}
+
+
+def makeCallback(chat_id: int, data: str) -> Dict[str, Any]:
+    '''Returns synthetic callback query update.
+    '''
+    update_id = next(_update_id)
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': _user(chat_id),
+            'chat_instance': str(chat_id),
+            'message': _message(chat_id, 'keyboard', message_id=7),
+            'data': data
+        }
+    }
+
+
+def dumps(update: Dict[str, Any]) -> bytes:
+    return json.dumps(update).encode()
@@ -3,17 +3,22 @@
 #  PcControl - Brain Server API.
 #  Created by LulzLoL231 at 04/11/20
 #
-import logging
-import json
+import random
+import asyncio
+from time import monotonic
+from collections import deque
 from logging import Logger
-from base64 import b64encode
 from datetime import datetime
-from typing import Any, Dict, Optional, Union
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple, Union
 
 import aiohttp
 
 import config
+import codec
+import metrics
 from log import getLogger
+from cache import TTLCache, FRESH, STALE
+from models import User, Device, Task, Version
 
 
 def getLog(func: str) -> Logger:
@@ -28,162 +33,619 @@ def getLog(func: str) -> Logger:
     return getLogger('PCON Brain API', func)
 
 
+class CircuitBreaker:
+    '''Error-rate circuit breaker for Brain requests.
+
+    States: "closed" (requests pass), "open" (requests fail fast),
+    "half-open" (one probe request is allowed after cooldown).
+    '''
+    def __init__(self,
+                 window: int = config.BRAIN_BREAKER_WINDOW,
+                 min_calls: int = config.BRAIN_BREAKER_MIN_CALLS,
+                 error_rate: float = config.BRAIN_BREAKER_ERROR_RATE,
+                 cooldown: float = config.BRAIN_BREAKER_COOLDOWN) -> None:
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.trips = 0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._probing = False
+
+    @property
+    def failureRate(self) -> float:
+        '''Returns failure rate in current window.
+
+        Returns:
+            float: failure rate from 0 to 1.
+        '''
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def allow(self) -> bool:
+        '''Checks if request may be sent now.
+
+        Returns:
+            bool: True or False.
+        '''
+        if self.state == 'closed':
+            return True
+        if self.state == 'open' and monotonic() - self.opened_at >= self.cooldown:
+            self.state = 'half-open'
+        if self.state == 'half-open' and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record(self, success: bool, probe: bool = False) -> None:
+        '''Records request outcome and switches state.
+
+        Outcomes of requests sent before the trip are ignored while breaker
+        is open or half-open, only the probe closes or trips it again.
+
+        Args:
+            success (bool): request was successful.
+            probe (bool): request was sent as half-open probe.
+        '''
+        if self.state == 'open' or (self.state == 'half-open' and not probe):
+            return
+        if self.state == 'half-open':
+            self._probing = False
+            if success:
+                self.state = 'closed'
+                self._outcomes.clear()
+            else:
+                self._trip()
+            return
+        self._outcomes.append(success)
+        if len(self._outcomes) >= self.min_calls and self.failureRate >= self.error_rate:
+            self._trip()
+
+    def release(self) -> None:
+        '''Ends half-open probe without outcome, e.g. when probe request was cancelled.
+        '''
+        self._probing = False
+
+    def _trip(self) -> None:
+        self.state = 'open'
+        self.opened_at = monotonic()
+        self.trips += 1
+
+    def getState(self) -> Dict[str, Any]:
+        '''Returns breaker state for admins.
+
+        Returns:
+            Dict[str, Any]: state dict.
+        '''
+        return {
+            'state': self.state,
+            'failure_rate': round(self.failureRate, 2),
+            'trips': self.trips
+        }
+
+
 class Brain:
     '''PCON Brain Server API.
     '''
+    AUTH_HEADER = '[REMOVED]'
+    URLS = {
+        'getDevicesForUser': '[REMOVED]',
+        'getDevice': '[REMOVED]',
+        'addTask': '[REMOVED]',
+        'getServerVersion': '[REMOVED]',
+        'getClientVersion': '[REMOVED]',
+        'flushTasks': '[REMOVED]',
+        'getTasksForDevice': '[REMOVED]',
+        'getUser': '[REMOVED]',
+        'addUser': '[REMOVED]',
+        'deleteUser': '[REMOVED]',
+        'getUsers': '[REMOVED]',
+        'updateDeviceInfo': '[REMOVED]'
+    }
+
     def __init__(self, endpoint: str = 'https://example.com:8080'):
         self.SECRET = '[REMOVED]'
-        self.tempdb: Dict[int, Dict[str, Any]] = {}
+        self.users = TTLCache('users',
+                              maxsize=config.USER_CACHE_MAXSIZE,
+                              ttl=config.USER_CACHE_TTL,
+                              negative_ttl=config.USER_CACHE_NEGATIVE_TTL,
+                              stale_ttl=config.USER_CACHE_STALE_TTL)
+        self.devices = TTLCache('devices',
+                                maxsize=config.DEVICE_CACHE_MAXSIZE,
+                                ttl=config.DEVICE_CACHE_TTL,
+                                stale_ttl=config.DEVICE_CACHE_STALE_TTL)
+        self.user_devices = TTLCache('user_devices',
+                                     maxsize=config.USER_CACHE_MAXSIZE,
+                                     ttl=config.DEVICE_CACHE_TTL,
+                                     stale_ttl=config.DEVICE_CACHE_STALE_TTL)
+        self._device_users: Dict[str, Set[int]] = {}
+        self._revalidating: Set[Tuple[str, Hashable]] = set()
+        self._inflight: Dict[Tuple[str, bytes, bool], asyncio.Task] = {}
+        self.onInvalidate: Optional[Callable[[str, Hashable], None]] = None
+        self.invalidationHooks: List[Callable[[str, Hashable], None]] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.body_codec: Optional[codec.Codec] = None
+        if config.BRAIN_BODY_FORMAT == 'raw':
+            self.body_codec = codec.json_codec
+        self.breaker = CircuitBreaker()
+        self.stats: Dict[str, int] = {
+            'requests': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'failures': 0,
+            'short_circuited': 0,
+            'coalesced': 0
+        }
         if config.DEV:
             self.endpoint = 'http://localhost:5000'
         else:
             self.endpoint = endpoint
 
-    async def _makeRequest(self, method: str, url: str, data: bytes = b'') -> dict:
+    def _getSession(self) -> aiohttp.ClientSession:
+        '''Returns shared keep-alive client session, creates it on first call.
+
+        Returns:
+            aiohttp.ClientSession: client session.
+        '''
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=config.BRAIN_POOL_LIMIT,
+                limit_per_host=config.BRAIN_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=config.BRAIN_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=config.BRAIN_DNS_CACHE_TTL
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    self.AUTH_HEADER: self.SECRET,
+                    'Accept': codec.getAccept(config.BRAIN_MSGPACK),
+                    'Accept-Encoding': 'gzip, deflate'
+                }
+            )
+        return self._session
+
+    def startSweepers(self) -> None:
+        '''Starts background sweepers of Brain caches. Call from running loop.
+        '''
+        self.users.startSweeper(config.CACHE_SWEEP_INTERVAL)
+        self.devices.startSweeper(config.CACHE_SWEEP_INTERVAL)
+        self.user_devices.startSweeper(config.CACHE_SWEEP_INTERVAL)
+
+    async def close(self) -> None:
+        '''Closes shared client session, connection pool and cache sweepers.
+        '''
+        await self.users.stopSweeper()
+        await self.devices.stopSweeper()
+        await self.user_devices.stopSweeper()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def available(self) -> bool:
+        '''Brain is considered available while circuit breaker is not open.
+
+        Returns:
+            bool: True or False.
+        '''
+        return self.breaker.state != 'open'
+
+    def getHealth(self) -> Dict[str, Any]:
+        '''Returns circuit breaker state and request counters.
+
+        Returns:
+            Dict[str, Any]: health dict.
+        '''
+        health = self.breaker.getState()
+        health.update(self.stats)
+        return health
+
+    def getCacheStats(self) -> Dict[str, Dict[str, Any]]:
+        '''Returns hit/miss counters of Brain caches.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: stats dict by cache name.
+        '''
+        return {
+            'users': self.users.getStats(),
+            'devices': self.devices.getStats(),
+            'user_devices': self.user_devices.getStats()
+        }
+
+    async def _readThrough(self, cache: TTLCache, key: Hashable,
+                           fetch: Callable[[], Awaitable[Any]]) -> Any:
+        '''Returns cached value, fetches it on miss.
+
+        Stale values are returned at once and refreshed in background.
+
+        Args:
+            cache (TTLCache): cache.
+            key (Hashable): cache key.
+            fetch (Callable[[], Awaitable[Any]]): fetcher, returns None on failure.
+
+        Returns:
+            Any: value or None.
+        '''
+        state, value = cache.lookup(key)
+        if state == FRESH:
+            return value
+        if state == STALE and value is not None:
+            if (cache.name, key) not in self._revalidating:
+                self._revalidating.add((cache.name, key))
+                asyncio.get_event_loop().create_task(
+                    self._revalidate(cache, key, fetch))
+            return value
+        value = await fetch()
+        if value is not None:
+            cache.set(key, value)
+        return value
+
+    async def _revalidate(self, cache: TTLCache, key: Hashable,
+                          fetch: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            value = await fetch()
+            if value is not None:
+                cache.set(key, value)
+        finally:
+            self._revalidating.discard((cache.name, key))
+
+    def invalidateDevice(self, device_uuid: str, notify: bool = True) -> None:
+        '''Drops cached device and device lists which contain it.
+
+        Args:
+            device_uuid (str): Device UUID.
+            notify (bool): call onInvalidate listener (other processes).
+        '''
+        self.devices.invalidate(device_uuid)
+        for user_id in self._device_users.pop(device_uuid, ()):
+            self.user_devices.invalidate(user_id)
+        for hook in self.invalidationHooks:
+            hook('device', device_uuid)
+        if notify and self.onInvalidate is not None:
+            self.onInvalidate('device', device_uuid)
+
+    def invalidateUser(self, id: int, notify: bool = True) -> None:
+        '''Drops cached user.
+
+        Args:
+            id (int): telegram id.
+            notify (bool): call onInvalidate listener (other processes).
+        '''
+        self.users.invalidate(id)
+        for hook in self.invalidationHooks:
+            hook('user', id)
+        if notify and self.onInvalidate is not None:
+            self.onInvalidate('user', id)
+
+    def applyInvalidation(self, kind: str, key: Hashable) -> None:
+        '''Applies invalidation received from another process.
+
+        Args:
+            kind (str): "user" or "device".
+            key (Hashable): telegram id or device UUID.
+        '''
+        if kind == 'user':
+            self.invalidateUser(key, notify=False)
+        elif kind == 'device':
+            self.invalidateDevice(key, notify=False)
+
+    def _encodeBody(self, payload: Dict[str, Any]) -> bytes:
+        '''Encodes request body: base64 JSON, or raw body of negotiated codec.
+
+        Args:
+            payload (Dict[str, Any]): request payload.
+
+        Returns:
+            bytes: body.
+        '''
+        if self.body_codec is None:
+            return codec.encodeLegacy(payload)
+        return self.body_codec.dumps(payload)
+
+    def _decodeBody(self, content_type: str, data: bytes) -> Any:
+        '''Decodes response body by its content type.
+
+        Brain, which answered with MessagePack, gets MessagePack request bodies too.
+
+        Args:
+            content_type (str): response content type.
+            data (bytes): response body, already decompressed.
+
+        Returns:
+            Any: response payload.
+        '''
+        body_codec = codec.getCodec(content_type)
+        if (self.body_codec is not None and body_codec.content_type == codec.MSGPACK
+                and self.body_codec is not body_codec):
+            getLog('_decodeBody').info('Brain supports MessagePack, switching request bodies.')
+            self.body_codec = body_codec
+        return body_codec.loads(data)
+
+    @staticmethod
+    def _getTimeout(endpoint: str) -> aiohttp.ClientTimeout:
+        '''Returns request timeout for Brain method.
+
+        Args:
+            endpoint (str): Brain method name.
+
+        Returns:
+            aiohttp.ClientTimeout: timeout.
+        '''
+        connect, read, total = config.BRAIN_TIMEOUTS.get(
+            endpoint, config.BRAIN_TIMEOUTS['default'])
+        return aiohttp.ClientTimeout(total=total, connect=connect, sock_read=read)
+
+    async def _makeRequest(self, method: str, url: str, data: bytes = b'',
+                           endpoint: str = 'default', errors: bool = False) -> dict:
         '''Make request to BRAIN server.
 
+        GET requests are retried with jittered exponential backoff, and
+        identical concurrent GET requests share one in-flight request,
+        so result dict is shared between callers and must not be modified.
+        Fails fast with empty dict while circuit breaker is open.
+
         Args:
             method (str): HTTP method.
             url (str): url method.
             data (bytes): body.
+            endpoint (str): Brain method name, used for timeouts.
+            errors (bool): return API error dicts instead of empty dict.
 
         Returns:
             dict: dict or empty dict.
         '''
         log = getLog('_makeRequest')
-        log.setLevel(logging.DEBUG if config.DEBUG else logging.INFO)
-        log.info(f'Called with args: ({method}, {url}) and data: ({str(data)})')
+        log.debug('Called with args: (%s, %s) and data: (%s)', method, url, data)
+        if method != 'GET':
+            return await self._makeAttempts(method, url, data, endpoint, errors)
+        key = (url, data, errors)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_event_loop().create_task(
+                self._makeAttempts(method, url, data, endpoint, errors))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats['coalesced'] += 1
+            log.debug('Joined in-flight request: (%s, %s)', method, url)
+        return await asyncio.shield(task)
+
+    async def _makeAttempts(self, method: str, url: str, data: bytes,
+                            endpoint: str, errors: bool) -> dict:
+        '''Sends request with retries and circuit breaker checks.
+
+        Args:
+            method (str): HTTP method.
+            url (str): url method.
+            data (bytes): body.
+            endpoint (str): Brain method name, used for timeouts.
+            errors (bool): return API error dicts instead of empty dict.
+
+        Returns:
+            dict: dict or empty dict.
+        '''
+        log = getLog('_makeAttempts')
+        attempts = 1 + (config.BRAIN_RETRIES if method == 'GET' else 0)
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self.stats['short_circuited'] += 1
+                log.warning('Circuit breaker is open, Brain request skipped.')
+                return {}
+            if attempt:
+                self.stats['retries'] += 1
+                backoff = min(config.BRAIN_RETRY_BACKOFF_MAX,
+                              config.BRAIN_RETRY_BACKOFF * 2 ** attempt)
+                await asyncio.sleep(random.uniform(0, backoff))
+            # only one request is admitted while half-open, it holds the probe
+            probe = self.breaker.state == 'half-open'
+            self.stats['requests'] += 1
+            try:
+                result, retryable = await self._sendRequest(method, url, data, endpoint, errors)
+            finally:
+                if probe:
+                    self.breaker.release()
+            self.breaker.record(not retryable, probe)
+            if not retryable:
+                return result
+            self.stats['failures'] += 1
+        return {}
+
+    async def _sendRequest(self, method: str, url: str, data: bytes,
+                           endpoint: str, errors: bool = False) -> Tuple[dict, bool]:
+        '''Sends single request to BRAIN server.
+
+        Args:
+            method (str): HTTP method.
+            url (str): url method.
+            data (bytes): body.
+            endpoint (str): Brain method name, used for timeouts.
+            errors (bool): return API error dicts instead of empty dict.
+
+        Returns:
+            Tuple[dict, bool]: result dict and is transport failure flag.
+        '''
+        started = monotonic()
+        result, retryable, status = await self._sendRequestOnce(method, url, data, endpoint, errors)
+        metrics.brain_latency.observe(monotonic() - started, method=endpoint)
+        metrics.brain_requests.inc(method=endpoint, status=status)
+        if 'error_type' in result or (not result and status != '200'):
+            metrics.brain_errors.inc(method=endpoint, error_type=result.get('error_type', status))
+        return (result, retryable)
+
+    async def _sendRequestOnce(self, method: str, url: str, data: bytes,
+                               endpoint: str, errors: bool) -> Tuple[dict, bool, str]:
+        log = getLog('_sendRequest')
         full_url = self.endpoint + url
+        headers = None
+        if data and self.body_codec is not None:
+            headers = {'Content-Type': self.body_codec.content_type}
         try:
-            async with aiohttp.request(method,
-                                       full_url,
-                                       headers={'[REMOVED]': self.SECRET},
-                                       data=data) as resp:
-                if resp.status != 500:
+            async with self._getSession().request(method,
+                                                  full_url,
+                                                  data=data,
+                                                  headers=headers,
+                                                  timeout=self._getTimeout(endpoint)) as resp:
+                if resp.status < 500:
                     try:
-                        result = await resp.json()
+                        result = self._decodeBody(resp.content_type, await resp.read())
                     except Exception as e:
-                        log.error(f'JSON Error: {str(e)}')
-                        return {}
+                        log.error('JSON Error: %s', e)
+                        return ({}, False, 'json_error')
                     else:
                         if 'error' in result.keys():
-                            log.error(
-                                f'API Error {str(resp.status)} {result["error_type"]}: {result["error"]}')
-                            return {}
+                            log.error('API Error %s %s: %s',
+                                      resp.status, result["error_type"], result["error"])
+                            return (result if errors else {}, False, str(resp.status))
                         else:
-                            log.debug(f'API result: {str(result)}')
-                            return result
+                            log.debug('API result: %s', result)
+                            return (result, False, str(resp.status))
                 else:
-                    log.error(
-                        'Brain internal server error. Request can\'t be processed.')
-                    return {}
+                    log.error('Brain server error %s. Request can\'t be processed.', resp.status)
+                    return ({}, True, str(resp.status))
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            log.error('Request Timeout: %s %s', method, url)
+            return ({}, True, 'timeout')
         except Exception as e:
-            log.error(f'Request Error: {str(e)}')
-            return {}
+            log.error('Request Error: %s', e)
+            return ({}, True, type(e).__name__)
 
-    async def getDevicesForUser(self, id: int) -> Optional[Union[list, None]]:
+    async def getDevicesForUser(self, id: int, fresh: bool = False) -> Optional[List[Device]]:
         '''Returns registered devices for specified user.
 
+        Args:
+            id (int): telegram id.
+            fresh (bool): skip cache, e.g. for fleet status watcher.
+
         Returns:
-            Optional[Union[list, None]]: Devices list or None if not found or unsuccessfull request.
+            Optional[List[Device]]: Devices list or None if not found or unsuccessfull request.
         '''
+        if fresh:
+            devices = await self._fetchDevicesForUser(id)
+            if devices is not None:
+                self.user_devices.set(id, devices)
+            return devices
+        return await self._readThrough(self.user_devices, id,
+                                       lambda: self._fetchDevicesForUser(id))
+
+    async def _fetchDevicesForUser(self, id: int) -> Optional[List[Device]]:
         log = getLog('getDevicesForUser')
-        log.info('Called.')
-        url = '[REMOVED]'
-        body = b64encode(json.dumps({'id': id}).encode())
-        result = await self._makeRequest('GET', url, body)
+        log.debug('Called.')
+        url = self.URLS['getDevicesForUser']
+        body = self._encodeBody({'id': id})
+        result = await self._makeRequest('GET', url, body, endpoint='getDevicesForUser')
         if result.get('ok', False):
-            return result['devices']
+            devices = [Device.fromDict(device) for device in result['devices']]
+            for device in devices:
+                self._device_users.setdefault(device.uuid, set()).add(id)
+            return devices
         log.warning('Request unsuccessfull.')
         return None
 
-    async def getDevice(self, device_uuid: str) -> Optional[Union[dict, None]]:
-        '''Returns device dict or None if not found.
+    async def getDevice(self, device_uuid: str) -> Optional[Device]:
+        '''Returns device or None if not found.
 
         Args:
             device_uuid (str): Device UUID.
 
         Returns:
-            Optional[Union[dict, None]]: device dict or None.
+            Optional[Device]: device or None.
         '''
+        return await self._readThrough(self.devices, device_uuid,
+                                       lambda: self._fetchDevice(device_uuid))
+
+    async def _fetchDevice(self, device_uuid: str) -> Optional[Device]:
         log = getLog('getDevice')
-        log.info(f'Called with args: ({device_uuid})')
-        url = '[REMOVED]'
-        body = b64encode(json.dumps({
+        log.debug('Called with args: (%s)', device_uuid)
+        url = self.URLS['getDevice']
+        body = self._encodeBody({
             'device_uuid': device_uuid
-        }).encode())
-        device = await self._makeRequest('GET', url, body)
+        })
+        device = await self._makeRequest('GET', url, body, endpoint='getDevice')
         if device.get('ok', False):
-            return device
+            return Device.fromDict(device['device'])
         if 'ok' in device:
-            log.error(
-                f'Request error: {device["error_type"]}: {device["error"]}')
+            log.error('Request error: %s: %s', device["error_type"], device["error"])
         else:
             log.warning('Request unsuccessfull.')
         return None
 
-    async def addTask(self, type: str, device_uuid: str) -> Optional[Union[int, None]]:
+    async def addTask(self, type: str, device_uuid: str,
+                      repeat: int = 1) -> Optional[Union[int, None]]:
         '''Returns task ID or None if unsuccessfull request.
 
         Args:
             type (str): Task Type (See README)
             device_uuid (str): Device UUID.
+            repeat (int): how many times device repeats task, e.g. folded volume taps.
+                Needs config.BRAIN_TASK_REPEAT.
 
         Returns:
             Optional[Union[int, None]]: Task ID or None.
         '''
         log = getLog('addTask')
-        log.info(f'Called with args: ({type}, {device_uuid})')
-        url = '[REMOVED]'
-        body = b64encode(json.dumps({
+        log.debug('Called with args: (%s, %s, %s)', type, device_uuid, repeat)
+        if repeat > 1 and not config.BRAIN_TASK_REPEAT:
+            log.error('Brain doesn\'t support task repeat, task "%s" x%s for %s not sent.',
+                      type, repeat, device_uuid)
+            return None
+        url = self.URLS['addTask']
+        payload = {
             'device_uuid': device_uuid,
             'type': type
-        }).encode())
-        task = await self._makeRequest('POST', url, body)
+        }
+        if repeat > 1:
+            payload['repeat'] = repeat
+        body = self._encodeBody(payload)
+        task = await self._makeRequest('POST', url, body, endpoint='addTask')
+        self.invalidateDevice(device_uuid)
         if task.get('ok', False):
-            log.info(f'Added new task "{type}" with #{task["id"]}@{device_uuid}')
+            log.info('Added new task "%s" with #%s@%s', type, task["id"], device_uuid)
             return task['id']
         if 'ok' in task:
-            log.error(f'Task create error: {task.get("error_type")}: {task.get("error")}')
+            log.error('Task create error: %s: %s', task.get("error_type"), task.get("error"))
         else:
-            log.error(f'Unknown error when try to create a new task "{type}" for device #{device_uuid}')
+            log.error('Unknown error when try to create a new task "%s" for device #%s',
+                      type, device_uuid)
         return None
 
-    async def getServerVersion(self) -> dict:
+    async def getServerVersion(self) -> Optional[Version]:
         '''Returns PCON Brain Server Version.
 
         Returns:
-            dict: Server version dict.
+            Optional[Version]: Server version or None.
         '''
         log = getLog('getServerVersion')
-        log.info('Called.')
-        url = '[REMOVED]'
-        result = await self._makeRequest('GET', url)
+        log.debug('Called.')
+        url = self.URLS['getServerVersion']
+        result = await self._makeRequest('GET', url, endpoint='getServerVersion')
         if result.get('ok', False):
-            return result
+            return Version.fromDict({k: v for k, v in result.items() if k != 'ok'})
         if 'ok' in result:
-            log.error(f'Request error: {result["error_type"]}: {result["error"]}')
+            log.error('Request error: %s: %s', result["error_type"], result["error"])
         else:
             log.warning('Request unsuccessfull.')
-        return {}
+        return None
 
-    async def getClientVersion(self) -> dict:
+    async def getClientVersion(self) -> Optional[Version]:
         '''Returnc PCON Client latest version.
 
         Returns:
-            dict: Client version dict.
+            Optional[Version]: Client version or None.
         '''
         log = getLog('getClientVersion')
-        log.info('Called.')
-        url = '[REMOVED]'
-        result = await self._makeRequest('GET', url)
+        log.debug('Called.')
+        url = self.URLS['getClientVersion']
+        result = await self._makeRequest('GET', url, endpoint='getClientVersion')
         if result.get('ok', False):
-            return result
+            return Version.fromDict({k: v for k, v in result.items() if k != 'ok'})
         if 'ok' in result:
-            log.error(f'Request error: {result["error_type"]}: {result["error"]}')
+            log.error('Request error: %s: %s', result["error_type"], result["error"])
         else:
             log.warning('Request unsuccessfull.')
-        return {}
+        return None
 
     async def flushTasks(self, device_uuid: str, admin_code: str) -> bool:
         '''Flushes tasks for specific device.
@@ -196,80 +658,83 @@ class Brain:
             bool: True or False.
         '''
         log = getLog('flushTasks')
-        log.info(f'Called with args: ({device_uuid}, {admin_code})')
-        url = '[REMOVED]'
-        body = b64encode(json.dumps({
+        log.debug('Called with args: (%s, %s)', device_uuid, admin_code)
+        url = self.URLS['flushTasks']
+        body = self._encodeBody({
             'device_uuid': device_uuid,
             'admin_code': admin_code
-        }).encode())
-        result = await self._makeRequest('DELETE', url, body)
+        })
+        result = await self._makeRequest('DELETE', url, body, endpoint='flushTasks')
+        self.invalidateDevice(device_uuid)
         if result.get('ok', False):
             return True
         if 'ok' in result:
-            log.error(f'Request error: {result["error_type"]}: {result["error"]}')
+            log.error('Request error: %s: %s', result["error_type"], result["error"])
         else:
             log.warning('Request unsuccessfull.')
         return False
 
-    async def getTasksForDevice(self, device_uuid: str) -> Optional[Union[list, None]]:
+    async def getTasksForDevice(self, device_uuid: str) -> Optional[List[Task]]:
         '''Returns all current tasks for specific device.
 
         Args:
             device_uuid (str): Device UUID.
 
         Returns:
-            Optional[Union[list, None]]: tasks array or None.
+            Optional[List[Task]]: tasks array or None.
         '''
         log = getLog('getTasksForDevice')
-        log.info(f'Called with args: ({device_uuid})')
-        url = '[REMOVED]'
-        body = b64encode(json.dumps({
+        log.debug('Called with args: (%s)', device_uuid)
+        url = self.URLS['getTasksForDevice']
+        body = self._encodeBody({
             'device_uuid': device_uuid
-        }).encode())
-        result = await self._makeRequest('GET', url, body)
+        })
+        result = await self._makeRequest('GET', url, body, endpoint='getTasksForDevice')
         if result.get('ok', False):
-            return result['tasks']
+            return [Task.fromDict(task) for task in result['tasks']]
         if 'ok' in result:
-            log.error(f'Request error: {result["error_type"]}: {result["error"]}')
+            log.error('Request error: %s: %s', result["error_type"], result["error"])
         else:
             log.warning('Request unsuccessfull.')
         return None
 
-    async def getUser(self, id: int) -> Optional[Union[dict, None]]:
+    async def getUser(self, id: int) -> Optional[User]:
         '''Return user info by telegram id.
 
         Args:
             id (int): telegram id.
 
         Returns:
-            Optional[Union[dict, None]]: dict, None.
+            Optional[User]: user or None.
         '''
         log = getLog('getUser')
-        log.info(f'Called with args: ({str(id)})')
-        log.info('Checking tempDB...')
-        if id in self.tempdb.keys():
-            td = (datetime.now() - self.tempdb[id]['fetched']).total_seconds()
-            if td <= 300:
-                log.info('User have unexpired access in tempDB.')
-                return self.tempdb[id]
-            else:
-                log.info('User expired access in tempDB.')
-                del(self.tempdb[id])
-        url = '[REMOVED]'
-        body = b64encode(json.dumps({
+        log.debug('Called with args: (%s)', id)
+        state, user = self.users.lookup(id)
+        if state == FRESH:
+            log.debug('User found in cache.')
+            return user
+        if state == STALE and user is not None and not self.available:
+            log.warning('Brain unavailable, using expired user from cache.')
+            return user
+        url = self.URLS['getUser']
+        body = self._encodeBody({
             'id': id
-        }).encode())
-        result = await self._makeRequest('GET', url, body)
+        })
+        result = await self._makeRequest('GET', url, body, endpoint='getUser', errors=True)
         if result.get('ok', False):
-            log.debug(f'Fetched user: {str(result["user"])}')
-            result['user'].update({'fetched': datetime.now()})
-            self.tempdb.update({id: result['user']})
-            log.info(f'User #{str(id)} added to tempDB.')
-            return result['user']
-        if 'ok' in result:
-            log.error(f'Request error: {result["error_type"]}: {result["error"]}')
+            log.debug('Fetched user: %s', result["user"])
+            user = User.fromDict(result['user'], fetched=datetime.now())
+            self.users.set(id, user)
+            log.info('User #%s added to cache.', id)
+            return user
+        if 'error' in result:
+            log.error('Request error: %s: %s', result["error_type"], result["error"])
+            self.users.setNegative(id)
         else:
             log.warning('Request unsuccessfull.')
+            if state == STALE and user is not None:
+                log.warning('Using expired user from cache.')
+                return user
         return None
 
     async def addUser(self,
@@ -289,19 +754,20 @@ class Brain:
             bool: True or False
         '''
         log = getLog('addUser')
-        log.info(f'Called with args: ({str(id), username, level})')
-        url = '[REMOVED]'
-        body = b64encode(json.dumps({
+        log.debug('Called with args: (%s, %s, %s)', id, username, level)
+        url = self.URLS['addUser']
+        body = self._encodeBody({
             'id': id,
             'username': username,
             'level': level,
             'admin_code': admin_code
-        }).encode())
-        result = await self._makeRequest('POST', url, body)
+        })
+        result = await self._makeRequest('POST', url, body, endpoint='addUser')
+        self.invalidateUser(id)
         if result.get('ok', False):
             return True
         if 'ok' in result:
-            log.error(f'Request error: {result["error_type"]}: {result["error"]}')
+            log.error('Request error: %s: %s', result["error_type"], result["error"])
         else:
             log.warning('Request unsuccessfull.')
         return False
@@ -319,35 +785,36 @@ class Brain:
             bool: True or False
         '''
         log = getLog('deleteUser')
-        log.info(f'Called with args: ({str(id)})')
-        url = '[REMOVED]'
-        body = b64encode(json.dumps({
+        log.debug('Called with args: (%s)', id)
+        url = self.URLS['deleteUser']
+        body = self._encodeBody({
             'id': id,
             'admin_code': admin_code
-        }).encode())
-        result = await self._makeRequest('DELETE', url, body)
+        })
+        result = await self._makeRequest('DELETE', url, body, endpoint='deleteUser')
+        self.invalidateUser(id)
         if result.get('ok', False):
             return True
         if 'ok' in result:
-            log.error(f'Request error: {result["error_type"]}: {result["error"]}')
+            log.error('Request error: %s: %s', result["error_type"], result["error"])
         else:
             log.warning('Request unsuccessfull.')
         return False
 
-    async def getUsers(self) -> Optional[Union[list, None]]:
+    async def getUsers(self) -> Optional[List[User]]:
         '''Returns all registered users.
 
         Returns:
-            Optional[Union[list, None]]: tasks array or None.
+            Optional[List[User]]: users array or None.
         '''
         log = getLog('getUsers')
-        log.info('Called!')
-        url = '[REMOVED]'
-        result = await self._makeRequest('GET', url)
+        log.debug('Called!')
+        url = self.URLS['getUsers']
+        result = await self._makeRequest('GET', url, endpoint='getUsers')
         if result.get('ok', False):
-            return result['users']
+            return [User.fromDict(user, fetched=None) for user in result['users']]
         if 'ok' in result:
-            log.error(f'Request error: {result["error_type"]}: {result["error"]}')
+            log.error('Request error: %s: %s', result["error_type"], result["error"])
         else:
             log.warning('Request unsuccessfull.')
         return None
@@ -367,21 +834,21 @@ class Brain:
             bool: Boolean.
         '''
         log = getLog('updateDeviceInfo')
-        log.info(f'Called with args: ({str(id)})')
-        url = '[REMOVED]'
-        body = b64encode(json.dumps({
+        log.debug('Called with args: (%s)', device_uuid)
+        url = self.URLS['updateDeviceInfo']
+        body = self._encodeBody({
             'device_uuid': device_uuid,
             'admin_code': admin_code,
             'updates': {
                 key: value
             }
-        }).encode())
-        result = await self._makeRequest('PATCH', url, body)
+        })
+        result = await self._makeRequest('PATCH', url, body, endpoint='updateDeviceInfo')
+        self.invalidateDevice(device_uuid)
         if result.get('ok', False):
             return True
         if 'ok' in result:
-            log.error(
-                f'Request error: {result["error_type"]}: {result["error"]}')
+            log.error('Request error: %s: %s', result["error_type"], result["error"])
         else:
             log.warning('Request unsuccessfull.')
         return False
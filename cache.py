@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - in-memory caches.
+#  Created by LulzLoL231 at 18/10/26
+#
+import asyncio
+from time import monotonic
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from log import getLogger
+
+
+MISS = 'miss'
+FRESH = 'fresh'
+STALE = 'stale'
+
+
+class TTLCache:
+    '''Bounded LRU cache with per-entry TTL.
+
+    Expired entries are kept for `stale_ttl` seconds more, so callers can
+    serve them when Brain is unavailable or while revalidating.
+    `None` values are negative entries (known missing keys).
+    `on_evict(key, value)` is called for entries evicted over maxsize or dropped as expired.
+    '''
+    def __init__(self, name: str, maxsize: int, ttl: float,
+                 negative_ttl: Optional[float] = None,
+                 stale_ttl: float = 0.0,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.on_evict = on_evict
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.lookup(key, count=False)[0] == FRESH
+
+    def lookup(self, key: Hashable, count: bool = True) -> Tuple[str, Any]:
+        '''Returns entry state and value.
+
+        Args:
+            key (Hashable): cache key.
+            count (bool): update hit/miss counters.
+
+        Returns:
+            Tuple[str, Any]: (MISS|FRESH|STALE, value).
+        '''
+        entry = self._data.get(key)
+        if entry is None:
+            if count:
+                self.misses += 1
+            return (MISS, None)
+        expires, value = entry
+        now = monotonic()
+        if now <= expires:
+            self._data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return (FRESH, value)
+        if count:
+            self.misses += 1
+        if now <= expires + self.stale_ttl:
+            return (STALE, value)
+        del self._data[key]
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+        return (MISS, None)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        '''Returns fresh value or default.
+
+        Args:
+            key (Hashable): cache key.
+            default (Any): returned on miss.
+
+        Returns:
+            Any: value.
+        '''
+        state, value = self.lookup(key)
+        return value if state == FRESH else default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        '''Stores value, evicts least recently used entries over maxsize.
+
+        Args:
+            key (Hashable): cache key.
+            value (Any): value, None means negative entry.
+            ttl (Optional[float]): entry TTL, defaults to cache TTL.
+        '''
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        self._data[key] = (monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted, (_, evicted_value) = self._data.popitem(last=False)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(evicted, evicted_value)
+
+    def setNegative(self, key: Hashable) -> None:
+        '''Stores negative entry for key.
+
+        Args:
+            key (Hashable): cache key.
+        '''
+        self.set(key, None, self.negative_ttl)
+
+    def invalidate(self, key: Hashable) -> bool:
+        '''Removes entry.
+
+        Args:
+            key (Hashable): cache key.
+
+        Returns:
+            bool: True if entry was removed.
+        '''
+        return self._data.pop(key, None) is not None
+
+    def clear(self) -> None:
+        '''Removes all entries.
+        '''
+        self._data.clear()
+
+    def sweep(self) -> int:
+        '''Removes entries expired beyond stale TTL.
+
+        Returns:
+            int: removed entries count.
+        '''
+        deadline = monotonic() - self.stale_ttl
+        expired = [k for k, (expires, _) in self._data.items() if expires < deadline]
+        for key in expired:
+            _, value = self._data.pop(key)
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+        return len(expired)
+
+    async def _sweepForever(self, interval: float) -> None:
+        log = getLogger('PCON Cache', self.name)
+        while True:
+            await asyncio.sleep(interval)
+            removed = self.sweep()
+            if removed:
+                log.debug('Swept %s expired entries.', removed)
+
+    def startSweeper(self, interval: float) -> None:
+        '''Starts background sweeper task on running loop.
+
+        Args:
+            interval (float): sweep interval in seconds.
+        '''
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_event_loop().create_task(
+                self._sweepForever(interval))
+
+    async def stopSweeper(self) -> None:
+        '''Stops background sweeper task.
+        '''
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    def getStats(self) -> Dict[str, Any]:
+        '''Returns cache counters.
+
+        Returns:
+            Dict[str, Any]: stats dict.
+        '''
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / total, 2) if total else 0.0
+        }
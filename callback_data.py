@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - compact signed callback data.
+#  Created by LulzLoL231 at 18/10/26
+#
+from uuid import UUID
+from struct import Struct
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import types
+
+import config
+from log import getLogger
+from cache import TTLCache
+from security import SIGN_SIZE, signBytes, verifyBytes
+
+
+# Action codes are part of wire format: append only, never reorder.
+ACTIONS = (
+    'control', 'lock', 'switch_proxy', 'vc_demount', 'reboot', 'shutdown',
+    'sleep', 'media_prev', 'media_play_pause', 'media_next', 'media_vol_max',
+    'media_vol_50', 'media_vol_min', 'media_vol_up', 'media_mute',
+    'media_vol_down', 'rename', 'usercontrol', 'renameuser', 'levelupuser',
+    'leveldownuser', 'deleteuser', 'devices_page', 'users_page', 'bulk_menu',
+    'bulk_lock', 'bulk_reboot', 'bulk_sleep', 'bulk_shutdown', 'bulk_confirm_lock',
+    'bulk_confirm_reboot', 'bulk_confirm_sleep', 'bulk_confirm_shutdown'
+)
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+PREFIX = '~'
+
+# Target kinds: device UUID (16 bytes), telegram ID (8 bytes), handle (4 bytes),
+# UTF-8 string (up to MAX_STRING bytes).
+KIND_UUID = 0
+KIND_ID = 1
+KIND_HANDLE = 2
+KIND_STRING = 3
+_header = Struct('>BB')
+_id = Struct('>q')
+_handle = Struct('>I')
+ID_MIN = -2 ** 63
+ID_MAX = 2 ** 63 - 1
+# Longest string target, which fits 64 bytes callback data with header and sign.
+MAX_STRING = 35
+
+
+class HandleTable:
+    '''Server-side table of short handles for targets, which are not UUIDs or IDs.
+    '''
+    def __init__(self) -> None:
+        self._handles: Dict[str, int] = {}
+        self._targets: List[str] = []
+
+    def getHandle(self, target: str) -> int:
+        handle = self._handles.get(target)
+        if handle is None:
+            handle = len(self._targets)
+            self._handles[target] = handle
+            self._targets.append(target)
+        return handle
+
+    def getTarget(self, handle: int) -> Optional[str]:
+        if handle < len(self._targets):
+            return self._targets[handle]
+        return None
+
+
+handles = HandleTable()
+_decoded = TTLCache('decoded_callbacks',
+                    maxsize=config.VERIFIED_SIGNS_MAXSIZE,
+                    ttl=config.VERIFIED_SIGNS_TTL)
+
+
+def _packTarget(target: str, handle: bool = True) -> Tuple[int, bytes]:
+    '''Packs target, so it is decoded back to the same string.
+
+    Only canonical numbers and lowercase UUIDs are packed as binary,
+    other targets are kept as strings, too long ones get a handle.
+    Handles live only in this process, so `handle=False` raises ValueError instead.
+    '''
+    try:
+        number = int(target)
+    except ValueError:
+        pass
+    else:
+        if ID_MIN <= number <= ID_MAX and str(number) == target:
+            return (KIND_ID, _id.pack(number))
+    try:
+        uuid = UUID(target)
+    except ValueError:
+        pass
+    else:
+        if str(uuid) == target:
+            return (KIND_UUID, uuid.bytes)
+    raw = target.encode()
+    if len(raw) <= MAX_STRING:
+        return (KIND_STRING, raw)
+    if not handle:
+        raise ValueError(f'Target is too long for callback data: {target}')
+    return (KIND_HANDLE, _handle.pack(handles.getHandle(target)))
+
+
+def encode(action: str, target: str, handle: bool = True) -> str:
+    '''Returns signed compact callback data for action on target.
+
+    Args:
+        action (str): action name, see ACTIONS.
+        target (str): device UUID, user ID or other string.
+        handle (bool): allow process-local handle for long targets.
+
+    Raises:
+        ValueError: target is too long and handle is not allowed.
+
+    Returns:
+        str: callback data.
+    '''
+    return encodeMany((action,), target, handle)[0]
+
+
+def encodeMany(actions: Iterable[str], target: str, handle: bool = True) -> List[str]:
+    '''Returns signed compact callback data for many actions on one target.
+
+    Target is packed once, e.g. for whole device keyboard.
+
+    Args:
+        actions (Iterable[str]): action names, see ACTIONS.
+        target (str): device UUID, user ID or other string.
+        handle (bool): allow process-local handle for long targets.
+
+    Raises:
+        ValueError: target is too long and handle is not allowed.
+
+    Returns:
+        List[str]: callback data in actions order.
+    '''
+    kind, packed = _packTarget(target, handle)
+    encoded = []
+    for action in actions:
+        payload = _header.pack(ACTION_CODES[action], kind) + packed
+        encoded.append(PREFIX + urlsafe_b64encode(payload + signBytes(payload)).decode().rstrip('='))
+    return encoded
+
+
+def _decode(data: str) -> Optional[Tuple[int, str]]:
+    decoded = _decoded.get(data)
+    if decoded is None:
+        decoded = _verifyAndUnpack(data)
+        if decoded is not None:
+            _decoded.set(data, decoded)
+    return decoded
+
+
+def _verifyAndUnpack(data: str) -> Optional[Tuple[int, str]]:
+    if not data.startswith(PREFIX):
+        return None
+    try:
+        raw = urlsafe_b64decode(data[1:] + '=' * (-(len(data) - 1) % 4))
+    except ValueError:
+        return None
+    payload, sign = raw[:-SIGN_SIZE], raw[-SIGN_SIZE:]
+    if len(payload) < _header.size or not verifyBytes(payload, sign):
+        return None
+    code, kind = _header.unpack_from(payload)
+    body = payload[_header.size:]
+    if code >= len(ACTIONS):
+        return None
+    if kind == KIND_UUID and len(body) == 16:
+        return (code, str(UUID(bytes=body)))
+    if kind == KIND_ID and len(body) == _id.size:
+        return (code, str(_id.unpack(body)[0]))
+    if kind == KIND_STRING and len(body) <= MAX_STRING:
+        try:
+            return (code, body.decode())
+        except UnicodeDecodeError:
+            return None
+    if kind == KIND_HANDLE and len(body) == _handle.size:
+        target = handles.getTarget(_handle.unpack(body)[0])
+        if target is not None:
+            return (code, target)
+    return None
+
+
+def decode(data: str) -> Optional[Tuple[str, str]]:
+    '''Verifies and decodes callback data.
+
+    Args:
+        data (str): callback data.
+
+    Returns:
+        Optional[Tuple[str, str]]: (action, target) or None if invalid.
+    '''
+    decoded = _decode(data)
+    if decoded is None:
+        return None
+    return (ACTIONS[decoded[0]], decoded[1])
+
+
+Handler = Callable[[types.CallbackQuery, str], Awaitable[None]]
+
+
+class CallbackRouter:
+    '''Dispatches compact callback data to handlers by action code.
+    '''
+    def __init__(self) -> None:
+        self._handlers: List[Optional[Handler]] = [None] * len(ACTIONS)
+
+    def register(self, action: str) -> Callable[[Handler], Handler]:
+        '''Decorator, registers handler for action.
+
+        Args:
+            action (str): action name, see ACTIONS.
+        '''
+        def decorator(handler: Handler) -> Handler:
+            self._handlers[ACTION_CODES[action]] = handler
+            return handler
+        return decorator
+
+    def filter(self, query: types.CallbackQuery) -> bool:
+        '''aiogram filter: callback data is compact callback data.
+        '''
+        return bool(query.data) and query.data.startswith(PREFIX)
+
+    async def dispatch(self, query: types.CallbackQuery) -> bool:
+        '''Calls handler for callback query.
+
+        Args:
+            query (types.CallbackQuery): callback query.
+
+        Returns:
+            bool: True if handler was found and called.
+        '''
+        decoded = _decode(query.data)
+        if decoded is None:
+            getLogger('PCON Callback', 'dispatch').warning(
+                'Invalid callback data from %s', query.from_user.id)
+            return False
+        handler = self._handlers[decoded[0]]
+        if handler is None:
+            return False
+        await handler(query, decoded[1])
+        return True
+
+
+router = CallbackRouter()
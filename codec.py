@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - Brain wire codecs.
+#  Created by LulzLoL231 at 18/10/26
+#
+import json
+from abc import ABC, abstractmethod
+from base64 import b64encode, b64decode
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+
+
+class Codec(ABC):
+    '''Serializes Brain request and response bodies.
+    '''
+    name = 'base'
+    content_type = ''
+
+    @abstractmethod
+    def dumps(self, obj: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def loads(self, data: bytes) -> Any:
+        ...
+
+
+class StdJSONCodec(Codec):
+    '''JSON codec on stdlib json.
+    '''
+    name = 'json'
+    content_type = JSON
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrJSONCodec(Codec):
+    '''JSON codec on orjson.
+    '''
+    name = 'orjson'
+    content_type = JSON
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgPackCodec(Codec):
+    '''MessagePack codec.
+    '''
+    name = 'msgpack'
+    content_type = MSGPACK
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+
+json_codec: Codec = OrJSONCodec() if orjson is not None else StdJSONCodec()
+msgpack_codec: Optional[Codec] = MsgPackCodec() if msgpack is not None else None
+CODECS: Dict[str, Codec] = {JSON: json_codec}
+if msgpack_codec is not None:
+    CODECS[MSGPACK] = msgpack_codec
+
+
+def getAccept(use_msgpack: bool = True) -> str:
+    '''Returns Accept header, MessagePack is preferred when installed.
+
+    Args:
+        use_msgpack (bool): offer MessagePack.
+
+    Returns:
+        str: header value.
+    '''
+    if use_msgpack and msgpack_codec is not None:
+        return f'{MSGPACK}, {JSON};q=0.9'
+    return JSON
+
+
+def getCodec(content_type: str) -> Codec:
+    '''Returns codec for response content type, JSON by default.
+
+    Args:
+        content_type (str): content type without parameters.
+
+    Returns:
+        Codec: codec.
+    '''
+    return CODECS.get(content_type, json_codec)
+
+
+def encodeLegacy(obj: Any) -> bytes:
+    '''Returns base64 JSON body, which Brain accepts from old clients.
+
+    Args:
+        obj (Any): payload.
+
+    Returns:
+        bytes: body.
+    '''
+    return b64encode(json_codec.dumps(obj))
+
+
+def decodeLegacy(data: bytes) -> Any:
+    '''Decodes base64 JSON body.
+
+    Args:
+        data (bytes): body.
+
+    Returns:
+        Any: payload.
+    '''
+    return json_codec.loads(b64decode(data))
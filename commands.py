@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - text commands router.
+#  Created by LulzLoL231 at 18/10/26
+#
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from aiogram import types
+
+from log import getLogger
+
+
+Handler = Callable[[types.Message], Awaitable[None]]
+# Text aliases by command name.
+TEXT_ALIASES: Dict[str, Tuple[str, ...]] = {
+    'help': ('помощь', 'хелп', 'хэлп'),
+    'hubs': ('хабы',),
+    'netstatus': ('статус сети', 'сеть'),
+    'devices': ('устройства',),
+    'version': ('ver', 'version', 'вер', 'версия'),
+    'users': ('usr', 'users', 'пользователи', 'юзеры'),
+    'bulk': ('bulk', 'массово', 'массовые задачи'),
+    'watch': ('watch', 'подписка', 'уведомления')
+}
+
+
+def normalize(text: str) -> str:
+    '''Returns text in alias form: lower case, single spaces.
+
+    Args:
+        text (str): message text.
+
+    Returns:
+        str: normalized text.
+    '''
+    return ' '.join(text.lower().split())
+
+
+def _buildAliases() -> Dict[str, str]:
+    aliases: Dict[str, str] = {}
+    for cmd, names in TEXT_ALIASES.items():
+        for name in names:
+            name = normalize(name)
+            if aliases.setdefault(name, cmd) != cmd:
+                raise ValueError(f'Alias "{name}" is used by "{aliases[name]}" and "{cmd}"')
+    return aliases
+
+
+ALIASES = _buildAliases()
+
+
+def getCommand(text: Optional[str]) -> Optional[str]:
+    '''Returns command name for text alias.
+
+    Args:
+        text (Optional[str]): message text.
+
+    Returns:
+        Optional[str]: command name or None.
+    '''
+    if not text:
+        return None
+    return ALIASES.get(normalize(text))
+
+
+class TextCommandRouter:
+    '''Dispatches text aliases to command handlers with one lookup.
+    '''
+    def __init__(self) -> None:
+        self._handlers: Dict[str, Handler] = {}
+
+    def register(self, cmd: str) -> Callable[[Handler], Handler]:
+        '''Decorator, registers handler for command.
+
+        Args:
+            cmd (str): command name, see TEXT_ALIASES.
+        '''
+        if cmd not in TEXT_ALIASES:
+            raise KeyError(cmd)
+
+        def decorator(handler: Handler) -> Handler:
+            self._handlers[cmd] = handler
+            return handler
+        return decorator
+
+    def filter(self, msg: types.Message) -> Union[bool, Dict[str, str]]:
+        '''aiogram filter: message text is alias of registered command.
+
+        Passes command name to handler as `text_cmd`.
+        '''
+        cmd = getCommand(msg.text)
+        if cmd is None or cmd not in self._handlers:
+            return False
+        return {'text_cmd': cmd}
+
+    async def dispatch(self, msg: types.Message, text_cmd: Optional[str] = None) -> bool:
+        '''Calls handler for text command.
+
+        Args:
+            msg (types.Message): telegram message.
+            text_cmd (Optional[str]): command name from filter.
+
+        Returns:
+            bool: True if handler was found and called.
+        '''
+        cmd = text_cmd or getCommand(msg.text)
+        handler = self._handlers.get(cmd)
+        if handler is None:
+            return False
+        getLogger('PCON Commands', 'dispatch').debug('"%s" is "%s" command alias.', msg.text, cmd)
+        await handler(msg)
+        return True
+
+
+router = TextCommandRouter()
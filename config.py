@@ -5,6 +5,7 @@
 #
 import logging
 from os import environ
+from secrets import token_urlsafe
 
 DEV = False
 DEBUG = False
@@ -19,6 +20,117 @@ elif 'pcon_DEBUG' in environ:
     DEBUG = True
 else:
     TOKEN = '[REMOVED]'
+TOKEN = environ.get('pcon_TOKEN', TOKEN)
+# Custom Bot API server base url, e.g. local Bot API server.
+TELEGRAM_API_SERVER = environ.get('pcon_TELEGRAM_API_SERVER')
+# Updates ingestion: "polling" or "webhook".
+MODE = environ.get('pcon_MODE', 'polling')
+WEBHOOK_HOST = 'https://example.com'
+WEBHOOK_PATH = '/pcon/[REMOVED]'
+# Sent by Telegram in X-Telegram-Bot-Api-Secret-Token header, random per start if not set.
+WEBHOOK_SECRET = environ.get('pcon_WEBHOOK_SECRET') or token_urlsafe(32)
+WEBAPP_HOST = '127.0.0.1'
+WEBAPP_PORT = int(environ.get('pcon_WEBAPP_PORT', 8443))
+WEBHOOK_CONCURRENCY = int(environ.get('pcon_WEBHOOK_CONCURRENCY', 64))
+# Worker processes, 0 runs everything in one process.
+WORKERS = int(environ.get('pcon_WORKERS', 0))
+WORKER_REPORT_INTERVAL = 30.0
+WORKER_STOP_TIMEOUT = 10.0
+# FSM storage: "memory" or "sqlite".
+FSM_STORAGE = environ.get('pcon_FSM_STORAGE', 'sqlite')
+FSM_DB_PATH = environ.get('pcon_FSM_DB_PATH', 'pcon_fsm.sqlite3')
+FSM_FLUSH_INTERVAL = 0.05
+FSM_BUSY_TIMEOUT = 5.0
+FSM_CACHE_TTL = 300.0
+FSM_CACHE_MAXSIZE = 10000
+# Devices and users per list page.
+LIST_PAGE_SIZE = 15
+# Rendered list rows cache.
+ROW_CACHE_TTL = 3600.0
+ROW_CACHE_MAXSIZE = 100000
+# Filtered devices lists cache, by devices snapshot.
+ACCESS_SNAPSHOTS_MAXSIZE = 1000
+# Distinct user and device groups sets.
+ACCESS_GROUP_SETS_MAXSIZE = 1024
+# Brain HTTP connection pool.
+BRAIN_POOL_LIMIT = int(environ.get('pcon_BRAIN_POOL_LIMIT', 100))
+BRAIN_POOL_LIMIT_PER_HOST = int(environ.get('pcon_BRAIN_POOL_LIMIT_PER_HOST', 20))
+BRAIN_KEEPALIVE_TIMEOUT = float(environ.get('pcon_BRAIN_KEEPALIVE_TIMEOUT', 30))
+BRAIN_DNS_CACHE_TTL = int(environ.get('pcon_BRAIN_DNS_CACHE_TTL', 300))
+# Brain request bodies: "legacy" (base64 JSON) or "raw" (JSON/MessagePack with Content-Type).
+BRAIN_BODY_FORMAT = environ.get('pcon_BRAIN_BODY_FORMAT', 'legacy')
+# Offer MessagePack responses to Brain, if msgpack is installed.
+BRAIN_MSGPACK = environ.get('pcon_BRAIN_MSGPACK', '1') == '1'
+# Brain timeouts (connect, read, total) in seconds, per Brain method.
+BRAIN_TIMEOUTS = {
+    'default': (3.0, 10.0, 15.0),
+    'getUsers': (3.0, 20.0, 30.0),
+    'getDevicesForUser': (3.0, 20.0, 30.0)
+}
+# Brain retries, only for idempotent GET requests.
+BRAIN_RETRIES = 2
+BRAIN_RETRY_BACKOFF = 0.2
+BRAIN_RETRY_BACKOFF_MAX = 2.0
+# Brain circuit breaker.
+BRAIN_BREAKER_WINDOW = 20
+BRAIN_BREAKER_MIN_CALLS = 5
+BRAIN_BREAKER_ERROR_RATE = 0.5
+BRAIN_BREAKER_COOLDOWN = 30.0
+# Users cache.
+USER_CACHE_TTL = 300.0
+USER_CACHE_NEGATIVE_TTL = 60.0
+USER_CACHE_STALE_TTL = 3600.0
+USER_CACHE_MAXSIZE = 10000
+# Devices cache, stale entries are served while revalidating.
+DEVICE_CACHE_TTL = 60.0
+DEVICE_CACHE_STALE_TTL = 600.0
+DEVICE_CACHE_MAXSIZE = 50000
+CACHE_SWEEP_INTERVAL = 60.0
+# Recently verified callback signatures.
+VERIFIED_SIGNS_TTL = 600.0
+VERIFIED_SIGNS_MAXSIZE = 10000
+# Rendered keyboards cache.
+KEYBOARD_CACHE_TTL = 3600.0
+KEYBOARD_CACHE_MAXSIZE = 5000
+# Metrics endpoint, worker #i in multi-worker mode uses METRICS_PORT + i.
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = int(environ.get('pcon_METRICS_PORT', 9108))
+METRICS_LOOP_LAG_INTERVAL = 0.5
+# Outbound messages queue: rates in messages per second.
+OUTBOX_ENABLED = environ.get('pcon_OUTBOX', '1') == '1'
+# Bot API limit is per bot, so worker processes share it.
+OUTBOX_GLOBAL_RATE = 30.0 / max(1, WORKERS)
+OUTBOX_CHAT_RATE = 1.0
+OUTBOX_CHAT_BURST = 3.0
+OUTBOX_MAXCHATS = 100000
+OUTBOX_CLOSE_TIMEOUT = 10.0
+# Brain accepts "repeat" field of new tasks. Off until Brain API supports it,
+# otherwise folded taps would silently become one step.
+BRAIN_TASK_REPEAT = environ.get('pcon_BRAIN_TASK_REPEAT', '0') == '1'
+# Repeated media control taps within window are sent as one task, needs BRAIN_TASK_REPEAT.
+TAP_DEBOUNCE_WINDOW = 0.7
+# Bulk tasks: parallel Brain requests and min interval between progress edits.
+BULK_CONCURRENCY = 10
+BULK_PROGRESS_INTERVAL = 1.0
+# Confirmed bulk tasks messages, repeated confirm taps within TTL are refused.
+BULK_CONFIRMED_MAXSIZE = 10000
+BULK_CONFIRMED_TTL = 3600.0
+# Tasks tracker: device poll interval grows from min to max while nothing changes.
+TRACKER_MIN_INTERVAL = 1.0
+TRACKER_MAX_INTERVAL = 15.0
+TRACKER_BACKOFF = 1.5
+TRACKER_TASK_TIMEOUT = 300.0
+# Task statuses, which mean device finished task. Other statuses are pending,
+# so unknown statuses wait for timeout instead of finishing tasks at once.
+TRACKER_FINISHED_STATUSES = frozenset(environ.get(
+    'pcon_TRACKER_FINISHED_STATUSES', 'done,completed,failed,error,cancelled').split(','))
+# Fleet status watcher: snapshot interval, alerts digest delay and size.
+WATCHER_INTERVAL = float(environ.get('pcon_WATCHER_INTERVAL', 60))
+WATCHER_DIGEST_DELAY = 10.0
+WATCHER_DIGEST_MAX_LINES = 30
+WATCHER_SUBSCRIBERS_PATH = environ.get('pcon_WATCHER_SUBSCRIBERS_PATH', 'pcon_watchers.json')
+# Min interval between sampled high-frequency log records per key.
+LOG_SAMPLE_INTERVAL = 60.0
 logging.basicConfig(
     format='[%(levelname)s] %(name)s (%(lineno)d) >> %(message)s',
     level=logging.DEBUG if DEBUG else logging.INFO)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - device and user control callbacks.
+#  Created by LulzLoL231 at 18/10/26
+#
+from typing import Any, Dict, Optional
+
+from aiogram import types
+from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.filters.state import State, StatesGroup
+
+import utils
+import debounce
+import security as sec
+import callback_data as cbd
+from emojis import Emojis
+from log import getLogger
+from models import User, Device
+from tracker import tracker
+from runtime import bot, brain
+from keyboards import Keyboards
+
+
+DEVICE_TASKS = ('lock', 'switch_proxy', 'vc_demount', 'reboot', 'shutdown', 'sleep',
+                'media_prev', 'media_play_pause', 'media_next', 'media_vol_max',
+                'media_vol_50', 'media_vol_min', 'media_vol_up', 'media_mute',
+                'media_vol_down')
+# Admin actions, which are confirmed with 2FA code, and prompts for new value.
+ADMIN_PROMPTS: Dict[str, Optional[str]] = {
+    'rename': 'Введите новый псевдоним устройства',
+    'renameuser': 'Введите новое имя пользователя',
+    'levelupuser': None,
+    'leveldownuser': None,
+    'deleteuser': None
+}
+CANCEL_ALIASES = ('отмена', '/cancel')
+
+
+class ControlStates(StatesGroup):
+    value = State()
+    admin_code = State()
+
+
+async def _getDevice(user: User, uuid: str) -> Optional[Device]:
+    devices = await brain.getDevicesForUser(user.id) or []
+    for device in utils.parseDevicesForUser(devices, user.level):
+        if device.uuid == uuid:
+            return device
+    return None
+
+
+@cbd.router.register('control')
+async def controlDevice(query: types.CallbackQuery, uuid: str) -> None:
+    user = await sec.getUser(query.message)
+    if user:
+        device = await _getDevice(user, uuid)
+        if device:
+            await query.message.edit_text(
+                utils.parseDevice(device),
+                reply_markup=Keyboards(user).controlDevice(device))
+    await query.answer()
+
+
+@cbd.router.register('devices_page')
+async def devicesPage(query: types.CallbackQuery, page: str) -> None:
+    user = await sec.getUser(query.message)
+    if user:
+        devices = await brain.getDevicesForUser(user.id) or []
+        devices = utils.parseDevicesForUser(devices, user.level)
+        cnt, key = utils.parseDevices(devices, int(page))
+        await query.message.edit_text(cnt, reply_markup=key)
+    await query.answer()
+
+
+async def deviceTask(query: types.CallbackQuery, uuid: str) -> None:
+    user = await sec.getUser(query.message)
+    if user is None or await _getDevice(user, uuid) is None:
+        await query.answer()
+        return
+    action = cbd.decode(query.data)[0]
+    if action in debounce.DEBOUNCED_ACTIONS:
+        count = debounce.debouncer.tap(user.id, uuid, action)
+        await query.answer(f'x{count}' if count > 1 else None)
+        return
+    task_id = await brain.addTask(action, uuid)
+    if task_id is None:
+        await query.answer(f'{Emojis.warning} Задача не отправлена.')
+        return
+    await query.answer()
+    msg = await query.message.answer(f'{Emojis.ok} <code>Задача "{action}" отправлена.</code>')
+    tracker.follow(msg, uuid, task_id, action)
+
+
+@cbd.router.register('usercontrol')
+async def controlUser(query: types.CallbackQuery, id: str) -> None:
+    admin = await sec.getUser(query.message)
+    if admin and admin.level == 'admin':
+        user = await brain.getUser(int(id))
+        if user:
+            await query.message.edit_text(
+                utils.parseUser(user),
+                reply_markup=Keyboards(admin).controlUser(user))
+    await query.answer()
+
+
+@cbd.router.register('users_page')
+async def usersPage(query: types.CallbackQuery, page: str) -> None:
+    admin = await sec.getUser(query.message)
+    if admin and admin.level == 'admin':
+        users = await brain.getUsers() or []
+        cnt, key = utils.parseUsers(users, int(page))
+        await query.message.edit_text(cnt, reply_markup=key)
+    await query.answer()
+
+
+async def adminAction(query: types.CallbackQuery, target: str) -> None:
+    '''Starts admin action: asks for new value, if needed, then for 2FA code.
+    '''
+    admin = await sec.getUser(query.message)
+    if not admin or admin.level != 'admin':
+        await query.answer()
+        return
+    action = cbd.decode(query.data)[0]
+    state = bot.current_state(chat=query.message.chat.id, user=query.from_user.id)
+    await state.set_data({'action': action, 'target': target})
+    prompt = ADMIN_PROMPTS[action]
+    if prompt is None:
+        await state.set_state(ControlStates.admin_code)
+        prompt = 'Введите код подтверждения'
+    else:
+        await state.set_state(ControlStates.value)
+    await query.answer()
+    await query.message.answer(f'{Emojis.pen} <code>{prompt} или "отмена":</code>')
+
+
+async def _cancelled(msg: types.Message, state: FSMContext) -> bool:
+    if not msg.text or msg.text.strip().lower() in CANCEL_ALIASES:
+        await state.finish()
+        await msg.answer(f'{Emojis.cancel} <code>Отменено.</code>')
+        return True
+    return False
+
+
+async def controlValue(msg: types.Message, state: FSMContext) -> None:
+    if await _cancelled(msg, state):
+        return
+    await state.update_data(value=msg.text.strip())
+    await state.set_state(ControlStates.admin_code)
+    await msg.answer(f'{Emojis.key} <code>Введите код подтверждения или "отмена":</code>')
+
+
+async def _applyAdminAction(data: Dict[str, Any], admin_code: str) -> bool:
+    action, target = data['action'], data['target']
+    if action == 'rename':
+        return await brain.updateDeviceInfo(target, 'alias', data['value'], admin_code)
+    user = await brain.getUser(int(target))
+    if user is None:
+        return False
+    if action == 'deleteuser':
+        return await brain.deleteUser(user.id, admin_code)
+    if action == 'renameuser':
+        return await brain.addUser(user.id, data['value'], admin_code, user.level)
+    level = 'admin' if action == 'levelupuser' else 'user'
+    return await brain.addUser(user.id, user.username, admin_code, level)
+
+
+async def controlCode(msg: types.Message, state: FSMContext) -> None:
+    if await _cancelled(msg, state):
+        return
+    data = await state.get_data()
+    await state.finish()
+    admin = await sec.getUser(msg)
+    if not admin or admin.level != 'admin':
+        return
+    try:
+        # 2FA code is not kept in chat history
+        await msg.delete()
+    except Exception as e:
+        getLogger('PCON Controls', 'controlCode').warning('Code message delete error: %s', e)
+    ok = await _applyAdminAction(data, msg.text.strip())
+    getLogger('PCON Controls', 'controlCode').info(
+        '"%s" for %s by %s: %s', data['action'], data['target'], admin.id, ok)
+    if ok:
+        await msg.answer(f'{Emojis.ok} <code>Готово.</code>')
+    else:
+        await msg.answer(f'{Emojis.warning} <code>Не выполнено, проверьте код подтверждения.</code>')
+
+
+for action in DEVICE_TASKS:
+    cbd.router.register(action)(deviceTask)
+for action in ADMIN_PROMPTS:
+    cbd.router.register(action)(adminAction)
+bot.register_message_handler(controlValue, state=ControlStates.value)
+bot.register_message_handler(controlCode, state=ControlStates.admin_code)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - media control taps debounce.
+#  Created by LulzLoL231 at 18/10/26
+#
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import config
+import metrics
+from log import getLogger
+from runtime import brain
+
+
+Key = Tuple[Hashable, str, str]
+AddTask = Callable[..., Awaitable[Optional[int]]]
+# Actions, which repeated taps are folded into one task with repeat count,
+# none while Brain doesn't support repeat count.
+DEBOUNCED_ACTIONS = frozenset((
+    'media_vol_up', 'media_vol_down', 'media_next', 'media_prev'
+) if config.BRAIN_TASK_REPEAT else ())
+
+
+class TapDebouncer:
+    '''Folds repeated taps of one (user, device, action) into one Brain task.
+
+    First tap opens `window` seconds window, all taps in it are sent
+    as one task with repeat count when window closes.
+
+    Args:
+        add_task (AddTask): Brain.addTask.
+        window (float): debounce window in seconds.
+    '''
+    def __init__(self, add_task: AddTask,
+                 window: float = config.TAP_DEBOUNCE_WINDOW) -> None:
+        self.add_task = add_task
+        self.window = window
+        self._pending: Dict[Key, List[Any]] = {}
+
+    def tap(self, user: Hashable, device_uuid: str, action: str) -> int:
+        '''Registers tap, task is sent when window closes.
+
+        Args:
+            user (Hashable): telegram id.
+            device_uuid (str): Device UUID.
+            action (str): task type.
+
+        Returns:
+            int: taps count in current window, 1 for first tap.
+        '''
+        metrics.taps.inc(action=action)
+        key = (user, device_uuid, action)
+        entry = self._pending.get(key)
+        if entry is not None:
+            entry[0] += 1
+            return entry[0]
+        handle = asyncio.get_event_loop().call_later(self.window, self._fire, key)
+        self._pending[key] = [1, handle]
+        return 1
+
+    def _fire(self, key: Key) -> None:
+        asyncio.get_event_loop().create_task(self._send(key))
+
+    async def _send(self, key: Key) -> Optional[int]:
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return None
+        entry[1].cancel()
+        _, device_uuid, action = key
+        metrics.tap_tasks.inc(action=action)
+        try:
+            return await self.add_task(action, device_uuid, repeat=entry[0])
+        except Exception as e:
+            getLogger('PCON Debounce', '_send').error(
+                'Task "%s" x%s for %s error: %s', action, entry[0], device_uuid, e)
+            return None
+
+    async def flush(self) -> None:
+        '''Sends all pending tasks now.
+        '''
+        if self._pending:
+            await asyncio.gather(*(self._send(key) for key in list(self._pending)))
+
+
+debouncer = TapDebouncer(brain.addTask)
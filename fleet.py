@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - bulk fleet tasks.
+#  Created by LulzLoL231 at 18/10/26
+#
+import asyncio
+from time import monotonic
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import types
+
+import config
+import access
+import commands
+import security as sec
+import callback_data as cbd
+from cache import TTLCache
+from emojis import Emojis
+from log import getLogger
+from models import User, Device
+from runtime import brain
+from tracker import tracker
+from keyboards import Keyboards
+
+
+BULK_ACTIONS = ('lock', 'reboot', 'sleep', 'shutdown')
+# Target kinds: "group:<group>", "access:<network access>".
+TARGET_KINDS = ('group', 'access')
+Progress = Callable[['BulkDispatch'], Awaitable[None]]
+# (chat id, message id) of confirmed bulk tasks.
+_confirmed = TTLCache('bulk_confirmed', maxsize=config.BULK_CONFIRMED_MAXSIZE,
+                      ttl=config.BULK_CONFIRMED_TTL)
+
+
+def parseTarget(target: str) -> Optional[Tuple[str, List[str]]]:
+    '''Parses bulk target.
+
+    Args:
+        target (str): bulk target, e.g. "group:office".
+
+    Returns:
+        Optional[Tuple[str, List[str]]]: target kind and values or None if invalid.
+    '''
+    kind, sep, value = target.partition(':')
+    if not sep or kind not in TARGET_KINDS or not value:
+        return None
+    return (kind, value.split(','))
+
+
+def resolveTargets(devices: List[Device], target: str) -> List[Device]:
+    '''Returns devices matched by bulk target, in devices order.
+
+    Args:
+        devices (List[Device]): devices available to admin.
+        target (str): bulk target.
+
+    Returns:
+        List[Device]: matched devices.
+    '''
+    parsed = parseTarget(target)
+    if parsed is None:
+        return []
+    kind, values = parsed
+    if kind == 'group':
+        uuids = access.index.devicesInGroups(devices, values)
+    else:
+        uuids = access.index.devicesWithAccess(devices, values)
+    return [device for device in devices if device.uuid in uuids]
+
+
+def getTargetName(target: str) -> str:
+    '''Returns human readable bulk target.
+
+    Args:
+        target (str): bulk target.
+
+    Returns:
+        str: target name.
+    '''
+    kind, values = parseTarget(target) or ('', [target])
+    if kind == 'group':
+        return f'группа {", ".join(values)}'
+    if kind == 'access':
+        return f'доступ {", ".join(values)}'
+    return target
+
+
+class BulkDispatch:
+    '''Sends one task to many devices with bounded concurrency.
+
+    Args:
+        action (str): task type, see BULK_ACTIONS.
+        devices (List[Device]): target devices.
+        concurrency (int): max parallel Brain requests.
+    '''
+    def __init__(self, action: str, devices: List[Device],
+                 concurrency: int = config.BULK_CONCURRENCY) -> None:
+        self.action = action
+        self.devices = devices
+        self.concurrency = concurrency
+        self.accepted: Dict[str, int] = {}
+        self.failed: List[Device] = []
+        self.finished = False
+        self.completed: Optional[int] = None
+
+    @property
+    def done(self) -> int:
+        return len(self.accepted) + len(self.failed)
+
+    async def run(self, progress: Optional[Progress] = None,
+                  interval: float = config.BULK_PROGRESS_INTERVAL) -> 'BulkDispatch':
+        '''Dispatches tasks, calls progress at most once per interval and on finish.
+
+        Args:
+            progress (Optional[Progress]): progress callback.
+            interval (float): min interval between progress calls.
+
+        Returns:
+            BulkDispatch: self.
+        '''
+        semaphore = asyncio.Semaphore(self.concurrency)
+        reported = {'at': monotonic()}
+
+        async def send(device: Device) -> None:
+            async with semaphore:
+                task_id = await brain.addTask(self.action, device.uuid)
+            if task_id is None:
+                self.failed.append(device)
+            else:
+                self.accepted[device.uuid] = task_id
+            if progress is not None and monotonic() - reported['at'] >= interval:
+                reported['at'] = monotonic()
+                await progress(self)
+
+        await asyncio.gather(*(send(device) for device in self.devices))
+        self.finished = True
+        if progress is not None:
+            await progress(self)
+        return self
+
+    async def wait(self, progress: Optional[Progress] = None) -> 'BulkDispatch':
+        '''Waits until devices finish accepted tasks, see tracker.TaskTracker.
+
+        Args:
+            progress (Optional[Progress]): called once all tasks are finished or timed out.
+
+        Returns:
+            BulkDispatch: self.
+        '''
+        results = await asyncio.gather(
+            *(tracker.track(uuid, task_id) for uuid, task_id in self.accepted.items()),
+            return_exceptions=True)
+        self.completed = sum(1 for result in results if not isinstance(result, BaseException))
+        if progress is not None:
+            await progress(self)
+        return self
+
+    def render(self, target: str) -> str:
+        '''Returns progress message content.
+
+        Args:
+            target (str): bulk target.
+
+        Returns:
+            str: message content.
+        '''
+        cnt = ['      <code>Массовая задача "{}" ({}):</code>\n\n'.format(
+            self.action, getTargetName(target))]
+        cnt.append(f'{Emojis.ok} Принято: <b>{len(self.accepted)}/{len(self.devices)}</b>\n')
+        if self.failed:
+            cnt.append(f'{Emojis.warning} Ошибок: <b>{len(self.failed)}</b>\n')
+            cnt.extend(f'  <code>{device.name}</code>\n' for device in self.failed[:20])
+        if self.completed is not None:
+            cnt.append(f'{Emojis.ok} Выполнено: <b>{self.completed}/{len(self.accepted)}</b>\n')
+        if not self.finished:
+            cnt.append('\n<i>Выполняется...</i>')
+        elif self.completed is None and self.accepted:
+            cnt.append('\n<i>Ожидание устройств...</i>')
+        return ''.join(cnt)
+
+
+async def _getAdmin(msg: types.Message) -> Optional[Tuple[User, List[Device]]]:
+    user = await sec.getUser(msg)
+    if not user or user.level != 'admin':
+        return None
+    return (user, await brain.getDevicesForUser(user.id) or [])
+
+
+@commands.router.register('bulk')
+async def bulkCmd(msg: types.Message) -> None:
+    '''Admin command: bulk tasks targets.
+    '''
+    admin = await _getAdmin(msg)
+    if admin is None:
+        return
+    user, devices = admin
+    groups = sorted({group for device in devices for group in device.groups})
+    accesses = sorted({device.network_access for device in devices})
+    await msg.answer('      <code>Массовые задачи, выберите устройства:</code>',
+                     reply_markup=Keyboards(user).bulkTargets(groups, accesses))
+
+
+@cbd.router.register('bulk_menu')
+async def bulkMenu(query: types.CallbackQuery, target: str) -> None:
+    admin = await _getAdmin(query.message)
+    if admin is not None:
+        user, devices = admin
+        count = len(resolveTargets(devices, target))
+        await query.message.edit_text(
+            '      <code>Массовая задача ({}), устройств: {}</code>'.format(
+                getTargetName(target), count),
+            reply_markup=Keyboards(user).bulkActions(target))
+    await query.answer()
+
+
+async def bulkTask(query: types.CallbackQuery, target: str) -> None:
+    admin = await _getAdmin(query.message)
+    if admin is not None:
+        user, devices = admin
+        action = cbd.decode(query.data)[0][len('bulk_'):]
+        await query.message.edit_text(
+            '      <code>Подтвердите "{}" ({}), устройств: {}</code>'.format(
+                Keyboards.bulk_actions_text[action], getTargetName(target),
+                len(resolveTargets(devices, target))),
+            reply_markup=Keyboards(user).bulkConfirm(action, target))
+    await query.answer()
+
+
+async def bulkConfirmed(query: types.CallbackQuery, target: str) -> None:
+    admin = await _getAdmin(query.message)
+    if admin is None:
+        await query.answer()
+        return
+    user, devices = admin
+    # second tap may come before confirmation buttons are removed
+    key = (query.message.chat.id, query.message.message_id)
+    if _confirmed.get(key) is not None:
+        await query.answer('Задача уже выполняется.')
+        return
+    _confirmed.set(key, True)
+    action = cbd.decode(query.data)[0][len('bulk_confirm_'):]
+    targets = resolveTargets(devices, target)
+    await query.answer(f'Устройств: {len(targets)}')
+    dispatch = BulkDispatch(action, targets)
+    progress_msg = query.message
+    await progress_msg.edit_text(dispatch.render(target))
+
+    async def progress(dispatch: BulkDispatch) -> None:
+        try:
+            await progress_msg.edit_text(dispatch.render(target))
+        except Exception as e:
+            getLogger('PCON Fleet', 'bulkConfirmed').warning('Progress edit error: %s', e)
+
+    await dispatch.run(progress)
+    getLogger('PCON Fleet', 'bulkConfirmed').info(
+        'Bulk "%s" for %s by %s: %s accepted, %s failed', action, target, user.id,
+        len(dispatch.accepted), len(dispatch.failed))
+    if dispatch.accepted:
+        # in background, so chat updates are not held while devices work
+        asyncio.get_event_loop().create_task(dispatch.wait(progress))
+
+
+for action in BULK_ACTIONS:
+    cbd.router.register(f'bulk_{action}')(bulkTask)
+    cbd.router.register(f'bulk_confirm_{action}')(bulkConfirmed)
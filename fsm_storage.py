@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - SQLite FSM storage.
+#  Created by LulzLoL231 at 18/10/26
+#
+import json
+import asyncio
+import sqlite3
+import threading
+from copy import deepcopy
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from aiogram.dispatcher.storage import BaseStorage
+
+import config
+from log import getLogger
+from cache import TTLCache, FRESH
+
+
+Key = Tuple[str, str]
+
+
+class SQLiteStorage(BaseStorage):
+    '''aiogram FSM storage on local SQLite database in WAL mode.
+
+    Writes are buffered and flushed in batches every `flush_interval` seconds.
+    Reads are served from in-process cache. Several processes may share
+    one database file, as long as every chat is handled by one process.
+    '''
+    def __init__(self, path: str = config.FSM_DB_PATH,
+                 flush_interval: float = config.FSM_FLUSH_INTERVAL) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(f'PRAGMA busy_timeout={int(config.FSM_BUSY_TIMEOUT * 1000)}')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS fsm ('
+            'chat TEXT NOT NULL, user TEXT NOT NULL, '
+            'state TEXT, data TEXT NOT NULL, bucket TEXT NOT NULL, '
+            'PRIMARY KEY (chat, user))'
+        )
+        self._lock = threading.Lock()
+        self._cache = TTLCache('fsm', maxsize=config.FSM_CACHE_MAXSIZE,
+                               ttl=config.FSM_CACHE_TTL)
+        self._pending: Dict[Key, Dict[str, Any]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    def _select(self, key: Key) -> Dict[str, Any]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT state, data, bucket FROM fsm WHERE chat = ? AND user = ?',
+                key
+            ).fetchone()
+        if row is None:
+            return {'state': None, 'data': {}, 'bucket': {}}
+        return {'state': row[0], 'data': json.loads(row[1]), 'bucket': json.loads(row[2])}
+
+    def _write(self, batch: List[Tuple[Key, Dict[str, Any]]]) -> None:
+        upserts = []
+        deletes = []
+        for key, record in batch:
+            if record['state'] is None and not record['data'] and not record['bucket']:
+                deletes.append(key)
+            else:
+                upserts.append((*key, record['state'],
+                                json.dumps(record['data']),
+                                json.dumps(record['bucket'])))
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.executemany(
+                    'INSERT INTO fsm (chat, user, state, data, bucket) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (chat, user) DO UPDATE SET '
+                    'state = excluded.state, data = excluded.data, bucket = excluded.bucket',
+                    upserts
+                )
+                self._db.executemany('DELETE FROM fsm WHERE chat = ? AND user = ?', deletes)
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    async def _getRecord(self, chat: Union[str, int, None],
+                         user: Union[str, int, None]) -> Tuple[Key, Dict[str, Any]]:
+        chat, user = self.check_address(chat=chat, user=user)
+        key = (str(chat), str(user))
+        if key in self._pending:
+            return (key, self._pending[key])
+        state, record = self._cache.lookup(key)
+        if state != FRESH:
+            record = await asyncio.get_event_loop().run_in_executor(None, self._select, key)
+            # record may be changed while row was selected, row is stale then
+            if key in self._pending:
+                return (key, self._pending[key])
+            state, cached = self._cache.lookup(key)
+            if state == FRESH:
+                return (key, cached)
+            self._cache.set(key, record)
+        return (key, record)
+
+    def _setRecord(self, key: Key, record: Dict[str, Any]) -> None:
+        self._cache.set(key, record)
+        self._pending[key] = record
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_event_loop().create_task(self._flushLater())
+
+    async def _flushLater(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception:
+            pass  # logged by flush, failed batch is pending again
+        # failed batch and changes made while flushing are written next time
+        if self._pending:
+            self._flusher = asyncio.get_event_loop().create_task(self._flushLater())
+
+    async def flush(self) -> None:
+        '''Writes all buffered changes to database.
+        '''
+        if not self._pending:
+            return
+        batch = list(self._pending.items())
+        self._pending = {}
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self._write, batch)
+        except Exception as e:
+            getLogger('PCON FSM Storage', 'flush').error('Flush error: %s', e)
+            for key, record in batch:
+                self._pending.setdefault(key, record)
+            raise
+
+    async def close(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        await self.flush()
+
+    async def wait_closed(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    async def get_state(self, *, chat: Union[str, int, None] = None,
+                        user: Union[str, int, None] = None,
+                        default: Optional[str] = None) -> Optional[str]:
+        _, record = await self._getRecord(chat, user)
+        return record['state'] if record['state'] is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat: Union[str, int, None] = None,
+                       user: Union[str, int, None] = None,
+                       default: Optional[Dict] = None) -> Dict:
+        _, record = await self._getRecord(chat, user)
+        return deepcopy(record['data']) if record['data'] else (default or {})
+
+    async def set_state(self, *, chat: Union[str, int, None] = None,
+                        user: Union[str, int, None] = None,
+                        state: Optional[Any] = None) -> None:
+        key, record = await self._getRecord(chat, user)
+        self._setRecord(key, dict(record, state=self.resolve_state(state)))
+
+    async def set_data(self, *, chat: Union[str, int, None] = None,
+                       user: Union[str, int, None] = None,
+                       data: Optional[Dict] = None) -> None:
+        key, record = await self._getRecord(chat, user)
+        self._setRecord(key, dict(record, data=deepcopy(data or {})))
+
+    async def update_data(self, *, chat: Union[str, int, None] = None,
+                          user: Union[str, int, None] = None,
+                          data: Optional[Dict] = None, **kwargs) -> None:
+        key, record = await self._getRecord(chat, user)
+        new_data = deepcopy(record['data'])
+        new_data.update(data or {}, **kwargs)
+        self._setRecord(key, dict(record, data=new_data))
+
+    def has_bucket(self) -> bool:
+        return True
+
+    async def get_bucket(self, *, chat: Union[str, int, None] = None,
+                         user: Union[str, int, None] = None,
+                         default: Optional[Dict] = None) -> Dict:
+        _, record = await self._getRecord(chat, user)
+        return deepcopy(record['bucket']) if record['bucket'] else (default or {})
+
+    async def set_bucket(self, *, chat: Union[str, int, None] = None,
+                         user: Union[str, int, None] = None,
+                         bucket: Optional[Dict] = None) -> None:
+        key, record = await self._getRecord(chat, user)
+        self._setRecord(key, dict(record, bucket=deepcopy(bucket or {})))
+
+    async def update_bucket(self, *, chat: Union[str, int, None] = None,
+                            user: Union[str, int, None] = None,
+                            bucket: Optional[Dict] = None, **kwargs) -> None:
+        key, record = await self._getRecord(chat, user)
+        new_bucket = deepcopy(record['bucket'])
+        new_bucket.update(bucket or {}, **kwargs)
+        self._setRecord(key, dict(record, bucket=new_bucket))
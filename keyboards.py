@@ -3,45 +3,118 @@
 #  PcControl - keyboards.
 #  Created by LulzLoL231 at 29/11/20
 #
+from typing import Callable, Dict, Hashable, Iterable, Set, Tuple
+
 from aiogram import types
 
-import security as sec
+import config
+import callback_data as cbd
+from cache import TTLCache, FRESH
 from emojis import Emojis
+from models import User, Device
+from runtime import brain
 from security import getLogger
 
 
+_markup_keys: Dict[Tuple[str, Hashable], Set[tuple]] = {}
+
+
+def _forgetMarkup(key: tuple, value: Tuple[Tuple[str, Hashable], types.base.TelegramObject]) -> None:
+    keys = _markup_keys.get(value[0])
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del _markup_keys[value[0]]
+
+
+_markups = TTLCache('keyboards',
+                    maxsize=config.KEYBOARD_CACHE_MAXSIZE,
+                    ttl=config.KEYBOARD_CACHE_TTL,
+                    on_evict=_forgetMarkup)
+
+
+def _memoize(owner: Tuple[str, Hashable], key: tuple,
+             build: Callable[[], types.base.TelegramObject]) -> types.base.TelegramObject:
+    '''Returns rendered markup from cache, renders it on miss.
+
+    Markup is shared between all callers and must be treated as read-only:
+    never call add/row/insert on it, build a new markup instead.
+
+    Args:
+        owner (Tuple[str, Hashable]): invalidation owner, e.g. ("device", uuid).
+        key (tuple): full render key.
+        build (Callable): markup builder.
+
+    Returns:
+        types.base.TelegramObject: markup.
+    '''
+    state, value = _markups.lookup(key)
+    if state == FRESH:
+        return value[1]
+    markup = build()
+    _markups.set(key, (owner, markup))
+    _markup_keys.setdefault(owner, set()).add(key)
+    return markup
+
+
+def invalidateMarkups(kind: str, id: Hashable) -> None:
+    '''Drops rendered markups of device or user.
+
+    Args:
+        kind (str): "device" or "user".
+        id (Hashable): device UUID or telegram id.
+    '''
+    for key in _markup_keys.pop((kind, id), ()):
+        _markups.invalidate(key)
+
+
+brain.invalidationHooks.append(invalidateMarkups)
+
+
 class Keyboards:
     '''PCON Telegram Keyboards class.
+
+    start, controlDevice and controlUser return memoized markups,
+    which are shared between users and must not be modified.
     '''
-    def __init__(self, user: dict) -> None:
-        self.hubs_text = 'Хабы'
-        self.devices_text = 'Устройства'
-        self.netstatus_text = 'Статус сетей'
-        self.help_text = 'Помощь'
-        self.users_text = 'Пользователи'
-        self.back_text = f'{Emojis.back_page} Назад'
-        self.lock_text = Emojis.lock
-        self.vc_demount_text = Emojis.key
-        self.switch_text = Emojis.switch
-        self.reboot_text = Emojis.reboot
-        self.sleep_text = Emojis.sleep
-        self.poweroff_text = Emojis.poweroff
-        self.media_play_pause_text = Emojis.play_pause
-        self.media_stop_text = Emojis.stop
-        self.media_prev_track_text = Emojis.prev_track
-        self.media_next_track_text = Emojis.next_track
-        self.media_max_volume_text = 'MAX'
-        self.media_50_volume_text = '50'
-        self.media_min_volume_text = 'MIN'
-        self.media_volume_up_text = Emojis.plus
-        self.media_volume_down_text = Emojis.minus
-        self.media_mute_text = Emojis.mute
-        self.user_level = user['level']
-        self.userctrl_delete_text = f'{Emojis.cancel} Отозвать права'
-        self.userctrl_rename_text = f'{Emojis.pen} Изменить имя'
-        self.userctrl_levelup_text = f'{Emojis.warning} Повысить права'
-        self.userctrl_leveldown_text = f'{Emojis.warning} Понизить права'
-        self.device_rename_alias_text = f'{Emojis.pen} Изменить псевдоним'
+    hubs_text = 'Хабы'
+    devices_text = 'Устройства'
+    netstatus_text = 'Статус сетей'
+    help_text = 'Помощь'
+    users_text = 'Пользователи'
+    back_text = f'{Emojis.back_page} Назад'
+    lock_text = Emojis.lock
+    vc_demount_text = Emojis.key
+    switch_text = Emojis.switch
+    reboot_text = Emojis.reboot
+    sleep_text = Emojis.sleep
+    poweroff_text = Emojis.poweroff
+    media_play_pause_text = Emojis.play_pause
+    media_stop_text = Emojis.stop
+    media_prev_track_text = Emojis.prev_track
+    media_next_track_text = Emojis.next_track
+    media_max_volume_text = 'MAX'
+    media_50_volume_text = '50'
+    media_min_volume_text = 'MIN'
+    media_volume_up_text = Emojis.plus
+    media_volume_down_text = Emojis.minus
+    media_mute_text = Emojis.mute
+    userctrl_delete_text = f'{Emojis.cancel} Отозвать права'
+    userctrl_rename_text = f'{Emojis.pen} Изменить имя'
+    userctrl_levelup_text = f'{Emojis.warning} Повысить права'
+    userctrl_leveldown_text = f'{Emojis.warning} Понизить права'
+    device_rename_alias_text = f'{Emojis.pen} Изменить псевдоним'
+    bulk_actions_text = {
+        'lock': f'{Emojis.lock} Заблокировать',
+        'reboot': f'{Emojis.reboot} Перезагрузить',
+        'sleep': f'{Emojis.sleep} Сон',
+        'shutdown': f'{Emojis.poweroff} Выключить'
+    }
+    bulk_confirm_text = f'{Emojis.ok} Подтвердить'
+    bulk_cancel_text = f'{Emojis.cancel} Отмена'
+
+    def __init__(self, user: User) -> None:
+        self.user_level = user.level
 
     def start(self) -> types.ReplyKeyboardMarkup:
         '''Returns telegram reply markup keyboard for "start" cmd.
@@ -49,6 +122,9 @@ class Keyboards:
         Returns:
             types.ReplyKeyboardMarkup: telegram markup keyboard.
         '''
+        return _memoize(('level', self.user_level), ('start', self.user_level), self._buildStart)
+
+    def _buildStart(self) -> types.ReplyKeyboardMarkup:
         key = types.ReplyKeyboardMarkup(resize_keyboard=True)
         if self.user_level == 'user':
             key.row(self.devices_text)
@@ -59,31 +135,41 @@ class Keyboards:
             key.row(self.users_text)
         return key
 
-    def controlDevice(self, device: dict) -> types.InlineKeyboardMarkup:
+    def controlDevice(self, device: Device) -> types.InlineKeyboardMarkup:
         '''Returns inline keyboard with device control buttons.
 
         Args:
-           device (dict): device info.
+           device (Device): device info.
 
         Returns:
             types.InlineKeyboardMarkup: telegram inline keyboard.
         '''
-        getLogger('keyboards', 'controlDevice').debug(
-            f'Called with device: {str(device)}')
+        getLogger('keyboards', 'controlDevice').debug('Called with device: %s', device)
+        render_key = ('device', device.uuid, device.type, device.platform_name,
+                      device.has_proxy, device.has_vc, self.user_level)
+        return _memoize(('device', device.uuid), render_key,
+                        lambda: self._buildControlDevice(device))
+
+    def _buildControlDevice(self, device: Device) -> types.InlineKeyboardMarkup:
+        actions = ('lock', 'switch_proxy', 'vc_demount', 'reboot', 'shutdown', 'sleep',
+                   'media_prev', 'media_play_pause', 'media_next', 'media_vol_max',
+                   'media_vol_50', 'media_vol_min', 'media_vol_up', 'media_mute',
+                   'media_vol_down', 'rename')
+        data = dict(zip(actions, cbd.encodeMany(actions, device.uuid)))
         key = types.InlineKeyboardMarkup()
         lockbtn = types.InlineKeyboardButton(
             self.lock_text,
-            callback_data=sec.signData(f'lock@{device["uuid"]}')
+            callback_data=data['lock']
         )
-        if device['type'] == 'PC' and device['platform_name'] == 'win32' and device['has_proxy'] is True:
+        if device.type == 'PC' and device.platform_name == 'win32' and device.has_proxy is True:
             switchbtn = types.InlineKeyboardButton(
                 self.switch_text,
-                callback_data=sec.signData(f'switch_proxy@{device["uuid"]}')
+                callback_data=data['switch_proxy']
             )
-            if device['has_vc'] is True:
+            if device.has_vc is True:
                 vc_demountbtn = types.InlineKeyboardButton(
                     self.vc_demount_text,
-                    callback_data=sec.signData(f'vc_demount@{device["uuid"]}')
+                    callback_data=data['vc_demount']
                 )
                 key.row(lockbtn, switchbtn, vc_demountbtn)
             else:
@@ -92,55 +178,55 @@ class Keyboards:
             key.row(lockbtn)
         rebootbtn = types.InlineKeyboardButton(
             self.reboot_text,
-            callback_data=sec.signData(f'reboot@{device["uuid"]}')
+            callback_data=data['reboot']
         )
         poweroffbtn = types.InlineKeyboardButton(
             self.poweroff_text,
-            callback_data=sec.signData(f'shutdown@{device["uuid"]}')
+            callback_data=data['shutdown']
         )
         sleepbtn = types.InlineKeyboardButton(
             self.sleep_text,
-            callback_data=sec.signData(f'sleep@{device["uuid"]}')
+            callback_data=data['sleep']
         )
         prev_track_btn = types.InlineKeyboardButton(
             self.media_prev_track_text,
-            callback_data=sec.signData(f'media_prev@{device["uuid"]}')
+            callback_data=data['media_prev']
         )
         play_pause_btn = types.InlineKeyboardButton(
             self.media_play_pause_text,
-            callback_data=sec.signData(f'media_play_pause@{device["uuid"]}')
+            callback_data=data['media_play_pause']
         )
         next_track_btn = types.InlineKeyboardButton(
             self.media_next_track_text,
-            callback_data=sec.signData(f'media_next@{device["uuid"]}')
+            callback_data=data['media_next']
         )
         vol_max_btn = types.InlineKeyboardButton(
             self.media_max_volume_text,
-            callback_data=sec.signData(f'media_vol_max@{device["uuid"]}')
+            callback_data=data['media_vol_max']
         )
         vol_50_btn = types.InlineKeyboardButton(
             self.media_50_volume_text,
-            callback_data=sec.signData(f'media_vol_50@{device["uuid"]}')
+            callback_data=data['media_vol_50']
         )
         vol_min_btn = types.InlineKeyboardButton(
             self.media_min_volume_text,
-            callback_data=sec.signData(f'media_vol_min@{device["uuid"]}')
+            callback_data=data['media_vol_min']
         )
         vol_up_btn = types.InlineKeyboardButton(
             self.media_volume_up_text,
-            callback_data=sec.signData(f'media_vol_up@{device["uuid"]}')
+            callback_data=data['media_vol_up']
         )
         mute_btn = types.InlineKeyboardButton(
             self.media_mute_text,
-            callback_data=sec.signData(f'media_mute@{device["uuid"]}')
+            callback_data=data['media_mute']
         )
         vol_down_btn = types.InlineKeyboardButton(
             self.media_volume_down_text,
-            callback_data=sec.signData(f'media_vol_down@{device["uuid"]}')
+            callback_data=data['media_vol_down']
         )
         rename_btn = types.InlineKeyboardButton(
             self.device_rename_alias_text,
-            callback_data=sec.signData(f'rename@{device["uuid"]}')
+            callback_data=data['rename']
         )
         back_btn = types.InlineKeyboardButton(
             self.back_text,
@@ -154,6 +240,65 @@ class Keyboards:
         key.row(back_btn)
         return key
 
+    def bulkTargets(self, groups: Iterable[str],
+                    accesses: Iterable[str]) -> types.InlineKeyboardMarkup:
+        '''Bulk tasks targets keyboard: device groups and network access classes.
+
+        Targets are sent in callback data itself, never as process-local handles,
+        so buttons stay valid after restart and in every worker. Targets too long
+        for callback data are skipped.
+
+        Args:
+            groups (Iterable[str]): device groups.
+            accesses (Iterable[str]): network access classes.
+
+        Returns:
+            types.InlineKeyboardMarkup: telegram inline keyboard.
+        '''
+        key = types.InlineKeyboardMarkup(2)
+        targets = [(f'Группа: {group}', f'group:{group}') for group in groups]
+        targets.extend((f'Доступ: {access}', f'access:{access}') for access in accesses)
+        for text, target in targets:
+            try:
+                data = cbd.encode('bulk_menu', target, handle=False)
+            except ValueError:
+                continue
+            key.insert(types.InlineKeyboardButton(text, callback_data=data))
+        return key
+
+    def bulkActions(self, target: str) -> types.InlineKeyboardMarkup:
+        '''Bulk tasks actions keyboard for target.
+
+        Args:
+            target (str): bulk target, e.g. "group:office".
+
+        Returns:
+            types.InlineKeyboardMarkup: telegram inline keyboard.
+        '''
+        actions = tuple(f'bulk_{action}' for action in self.bulk_actions_text)
+        key = types.InlineKeyboardMarkup(2)
+        for text, data in zip(self.bulk_actions_text.values(),
+                              cbd.encodeMany(actions, target, handle=False)):
+            key.insert(types.InlineKeyboardButton(text, callback_data=data))
+        return key
+
+    def bulkConfirm(self, action: str, target: str) -> types.InlineKeyboardMarkup:
+        '''Bulk task confirmation keyboard.
+
+        Args:
+            action (str): bulk action, see fleet.BULK_ACTIONS.
+            target (str): bulk target.
+
+        Returns:
+            types.InlineKeyboardMarkup: telegram inline keyboard.
+        '''
+        confirm, cancel = cbd.encodeMany((f'bulk_confirm_{action}', 'bulk_menu'),
+                                         target, handle=False)
+        key = types.InlineKeyboardMarkup()
+        key.row(types.InlineKeyboardButton(self.bulk_confirm_text, callback_data=confirm),
+                types.InlineKeyboardButton(self.bulk_cancel_text, callback_data=cancel))
+        return key
+
     def getReturnKey(self) -> types.InlineKeyboardMarkup:
         '''Returns 'Return' button keyboard.
 
@@ -167,33 +312,39 @@ class Keyboards:
         ))
         return key
 
-    def controlUser(self, user: dict) -> types.InlineKeyboardMarkup:
+    def controlUser(self, user: User) -> types.InlineKeyboardMarkup:
         '''User control keyboard.
 
         Args:
-            user (dict): user info.
+            user (User): user info.
 
         Returns:
             types.InlineKeyboardMarkup: telegram inline keyboard.
         '''
-        getLogger('keyboards', 'controlUser').debug(f'Called with user: {str(user)}')
+        getLogger('keyboards', 'controlUser').debug('Called with user: %s', user)
+        render_key = ('user', user.id, user.level, self.user_level)
+        return _memoize(('user', user.id), render_key, lambda: self._buildControlUser(user))
+
+    def _buildControlUser(self, user: User) -> types.InlineKeyboardMarkup:
+        actions = ('renameuser', 'levelupuser', 'leveldownuser', 'deleteuser')
+        data = dict(zip(actions, cbd.encodeMany(actions, str(user.id))))
         rename_btn = types.InlineKeyboardButton(
             self.userctrl_rename_text,
-            callback_data=sec.signData(f'renameuser@{str(user["id"])}')
+            callback_data=data['renameuser']
         )
-        if user['level'] == 'user':
+        if user.level == 'user':
             level_btn = types.InlineKeyboardButton(
                 self.userctrl_levelup_text,
-                callback_data=sec.signData(f'levelupuser@{str(user["id"])}')
+                callback_data=data['levelupuser']
             )
         else:
             level_btn = types.InlineKeyboardButton(
                 self.userctrl_leveldown_text,
-                callback_data=sec.signData(f'leveldownuser@{str(user["id"])}')
+                callback_data=data['leveldownuser']
             )
         delete_btn = types.InlineKeyboardButton(
             self.userctrl_delete_text,
-            callback_data=sec.signData(f'deleteuser@{str(user["id"])}')
+            callback_data=data['deleteuser']
         )
         key = types.InlineKeyboardMarkup()
         key.row(rename_btn)
@@ -3,14 +3,25 @@
 #  PcControl - logging funcs.
 #  Created by LulzLoL231 at 04/11/20
 #
+import queue
+import atexit
 import logging
+from time import monotonic
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Hashable, Optional, Tuple
 
 import config
 
 
+_loggers: Dict[Tuple[str, str], logging.Logger] = {}
+_listener: Optional[QueueListener] = None
+
+
 def getLogger(module: str, name: str) -> logging.Logger:
     '''getLogger: returns named logger ready for work.
 
+    Loggers are created and configured once, then returned from cache.
+
     Args:
         module (str): module name.
         name (str): logger name.
@@ -18,6 +29,65 @@ def getLogger(module: str, name: str) -> logging.Logger:
     Returns:
         logging.Logger: Logger instance.
     '''
-    log = logging.getLogger(f'{module}::{name}')
-    log.setLevel(logging.DEBUG if config.DEV else logging.INFO)
+    log = _loggers.get((module, name))
+    if log is None:
+        log = logging.getLogger(f'{module}::{name}')
+        log.setLevel(logging.DEBUG if config.DEV else logging.INFO)
+        _loggers[(module, name)] = log
     return log
+
+
+def startListener() -> None:
+    '''Moves root handlers behind QueueHandler, so event loop never waits for log I/O.
+    '''
+    global _listener
+    if _listener is not None:
+        return
+    root = logging.getLogger()
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [QueueHandler(log_queue)]
+    _listener.start()
+
+
+def stopListener() -> None:
+    '''Flushes queued records and stops listener thread.
+    '''
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RateSampler:
+    '''Allows one log record per key in `interval` seconds.
+    '''
+    def __init__(self, interval: float = config.LOG_SAMPLE_INTERVAL,
+                 maxsize: int = 10000) -> None:
+        self.interval = interval
+        self.maxsize = maxsize
+        self._last: Dict[Hashable, float] = {}
+        self._suppressed: Dict[Hashable, int] = {}
+
+    def allow(self, key: Hashable) -> int:
+        '''Checks if record for key may be logged now.
+
+        Args:
+            key (Hashable): record key, e.g. chat ID.
+
+        Returns:
+            int: 0 if record should be dropped, else records count since last logged one.
+        '''
+        now = monotonic()
+        if now - self._last.get(key, -self.interval) < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return 0
+        if len(self._last) >= self.maxsize:
+            self._last.clear()
+            self._suppressed.clear()
+        self._last[key] = now
+        return self._suppressed.pop(key, 0) + 1
+
+
+startListener()
+atexit.register(stopListener)
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - metrics.
+#  Created by LulzLoL231 at 18/10/26
+#
+import asyncio
+from bisect import bisect_left
+from time import monotonic
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+import config
+from log import getLogger
+
+
+Labels = Tuple[Tuple[str, str], ...]
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Commands and plain callback data with own handler label, others are labeled "other",
+# so input from any chat can't create new series.
+KNOWN_COMMANDS = frozenset(('start', 'help', 'version', 'metrics'))
+KNOWN_CALLBACKS = frozenset(('devices', 'users', 'deleteLogMsg'))
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatLabels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    '''Monotonic counter with labels.
+    '''
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        for labels, value in self.values.items():
+            yield f'{self.name}{_formatLabels(labels)} {value}'
+
+
+class Gauge(Counter):
+    '''Value, which can go up and down.
+    '''
+    kind = 'gauge'
+
+    def set(self, value: float, **labels: Any) -> None:
+        self.values[_labels(labels)] = value
+
+
+class Histogram:
+    '''Cumulative histogram with labels.
+    '''
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _labels(labels)
+        series = self.values.get(key)
+        if series is None:
+            # bucket counters, +Inf, sum
+            series = self.values[key] = [0.0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def getStats(self, **labels: Any) -> Tuple[int, float]:
+        '''Returns observations count and sum.
+        '''
+        series = self.values.get(_labels(labels))
+        if series is None:
+            return (0, 0.0)
+        return (int(sum(series[:-1])), series[-1])
+
+    def render(self) -> Iterable[str]:
+        for labels, series in self.values.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f'{self.name}_bucket{_formatLabels(labels, ("le", str(bound)))} {cumulative}'
+            cumulative += series[-2]
+            yield f'{self.name}_bucket{_formatLabels(labels, ("le", "+Inf"))} {cumulative}'
+            yield f'{self.name}_sum{_formatLabels(labels)} {series[-1]}'
+            yield f'{self.name}_count{_formatLabels(labels)} {cumulative}'
+
+
+class Registry:
+    '''Metrics registry, renders Prometheus text format.
+    '''
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Any] = {}
+        self.collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self.metrics.setdefault(name, Gauge(name, help))
+
+    def histogram(self, name: str, help: str,
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def addCollector(self, collector: Callable[[], None]) -> None:
+        '''Adds callback, which updates gauges right before render.
+        '''
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+brain_latency = registry.histogram('pcon_brain_request_seconds', 'Brain request latency by method.')
+brain_requests = registry.counter('pcon_brain_requests_total', 'Brain requests by method and status.')
+brain_errors = registry.counter('pcon_brain_errors_total', 'Brain errors by method and error type.')
+handler_latency = registry.histogram('pcon_handler_seconds', 'Update handler latency by command or action.')
+telegram_latency = registry.histogram('pcon_telegram_request_seconds', 'Telegram Bot API latency by method.')
+loop_lag = registry.histogram('pcon_event_loop_lag_seconds', 'Event loop lag.',
+                              (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+cache_hits = registry.gauge('pcon_cache_hits', 'Cache hits by cache.')
+cache_misses = registry.gauge('pcon_cache_misses', 'Cache misses by cache.')
+cache_size = registry.gauge('pcon_cache_size', 'Cache entries by cache.')
+outbox_depth = registry.gauge('pcon_outbox_depth', 'Queued outbound Telegram requests.')
+outbox_chats = registry.gauge('pcon_outbox_chats', 'Chats with queued outbound requests.')
+outbox_delay = registry.histogram('pcon_outbox_delay_seconds', 'Outbound request queueing delay by method.')
+outbox_coalesced = registry.counter('pcon_outbox_coalesced_total', 'Coalesced message edits by method.')
+outbox_retry_after = registry.counter('pcon_outbox_retry_after_total', 'Retry-after answers by method.')
+taps = registry.counter('pcon_taps_total', 'Debounced control taps by action.')
+tap_tasks = registry.counter('pcon_tap_tasks_total', 'Brain tasks sent for debounced taps by action.')
+tracker_tasks = registry.gauge('pcon_tracker_tasks', 'Tracked unfinished tasks.')
+tracker_devices = registry.gauge('pcon_tracker_devices', 'Devices with tasks poller.')
+tracker_polls = registry.counter('pcon_tracker_polls_total', 'Device tasks polls.')
+watcher_ticks = registry.counter('pcon_watcher_ticks_total', 'Fleet snapshots fetched by watcher.')
+watcher_changes = registry.counter('pcon_watcher_changes_total', 'Fleet transitions by kind.')
+
+
+def collectCaches(stats: Callable[[], Dict[str, Dict[str, Any]]]) -> None:
+    '''Registers cache stats provider, e.g. Brain.getCacheStats.
+
+    Args:
+        stats (Callable): returns stats dict by cache name.
+    '''
+    def collector() -> None:
+        for name, cache in stats().items():
+            cache_hits.set(cache['hits'], cache=name)
+            cache_misses.set(cache['misses'], cache=name)
+            cache_size.set(cache['size'], cache=name)
+    registry.addCollector(collector)
+
+
+def getHandlerName(update: Any) -> str:
+    '''Returns handler label for message or callback query.
+
+    Labels are bounded: unknown commands and callback data are "other".
+
+    Args:
+        update (Any): types.Message or types.CallbackQuery.
+
+    Returns:
+        str: label.
+    '''
+    import commands
+    if isinstance(update, types.CallbackQuery):
+        import callback_data as cbd
+        decoded = cbd.decode(update.data or '')
+        if decoded is not None:
+            return f'callback:{decoded[0]}'
+        if update.data in KNOWN_CALLBACKS:
+            return f'callback:{update.data}'
+        return 'callback:other'
+    command = update.get_command(pure=True) if update.text else None
+    if not command:
+        return 'message'
+    command = command.lower()
+    if command in KNOWN_COMMANDS or command in commands.TEXT_ALIASES:
+        return f'command:{command}'
+    return 'command:other'
+
+
+class MetricsMiddleware(BaseMiddleware):
+    '''Measures message and callback query handlers latency.
+    '''
+    async def on_pre_process_message(self, message: types.Message, data: dict) -> None:
+        data['_metrics_started'] = monotonic()
+
+    async def on_post_process_message(self, message: types.Message,
+                                      results: list, data: dict) -> None:
+        handler_latency.observe(monotonic() - data['_metrics_started'],
+                                handler=getHandlerName(message))
+
+    async def on_pre_process_callback_query(self, query: types.CallbackQuery, data: dict) -> None:
+        data['_metrics_started'] = monotonic()
+
+    async def on_post_process_callback_query(self, query: types.CallbackQuery,
+                                             results: list, data: dict) -> None:
+        handler_latency.observe(monotonic() - data['_metrics_started'],
+                                handler=getHandlerName(query))
+
+
+class MeteredBot(Bot):
+    '''Bot, which measures every Bot API request.
+    '''
+    async def request(self, method: str, data: Optional[Dict] = None,
+                      files: Optional[Dict] = None, **kwargs: Any) -> Any:
+        started = monotonic()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        finally:
+            telegram_latency.observe(monotonic() - started, method=method)
+
+
+async def watchLoopLag(interval: float = config.METRICS_LOOP_LAG_INTERVAL) -> None:
+    '''Measures how late event loop wakes up sleeping task.
+    '''
+    while True:
+        started = monotonic()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, monotonic() - started - interval))
+
+
+async def _handleMetrics(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type='text/plain')
+
+
+async def startServer(host: str = config.METRICS_HOST,
+                      port: int = config.METRICS_PORT) -> web.AppRunner:
+    '''Starts local Prometheus endpoint on /metrics.
+
+    Returns:
+        web.AppRunner: runner, call cleanup() on shutdown.
+    '''
+    app = web.Application()
+    app.router.add_get('/metrics', _handleMetrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    getLogger('PCON Metrics', 'startServer').info('Serving metrics on %s:%s', host, port)
+    return runner
+
+
+def getSummary() -> str:
+    '''Returns short metrics summary for admins.
+
+    Returns:
+        str: message content.
+    '''
+    registry.render()
+    cnt = '      <code>Метрики:</code>\n\n<b>Brain:</b>\n'
+    for labels in brain_latency.values:
+        count, total = brain_latency.getStats(**dict(labels))
+        cnt += '{}: <code>{} шт, {:.0f} мс</code>\n'.format(
+            dict(labels)['method'], count, total / count * 1000 if count else 0)
+    cnt += '\n<b>Обработчики:</b>\n'
+    for labels in handler_latency.values:
+        count, total = handler_latency.getStats(**dict(labels))
+        cnt += '{}: <code>{} шт, {:.0f} мс</code>\n'.format(
+            dict(labels)['handler'], count, total / count * 1000 if count else 0)
+    cnt += '\n<b>Кэши:</b>\n'
+    for labels, hits in cache_hits.values.items():
+        misses = cache_misses.values.get(labels, 0)
+        total = hits + misses
+        cnt += '{}: <code>{:.0f}%</code>\n'.format(
+            dict(labels)['cache'], hits / total * 100 if total else 0)
+    count, total = loop_lag.getStats()
+    cnt += '\n<b>Задержка цикла:</b> <code>{:.1f} мс</code>'.format(
+        total / count * 1000 if count else 0)
+    return cnt
+
+
+async def metricsCmd(msg: types.Message) -> None:
+    '''Admin command: sends metrics summary and Brain circuit breaker state.
+    '''
+    import utils
+    import security as sec
+    from runtime import brain
+    user = await sec.getUser(msg)
+    if user and user.level == 'admin':
+        await msg.answer(getSummary())
+        await msg.answer(utils.parseBrainHealth(brain.getHealth()))
+
+
+async def setup(dp: Dispatcher, cache_stats: Callable[[], Dict[str, Dict[str, Any]]],
+                port: int = config.METRICS_PORT) -> web.AppRunner:
+    '''Enables metrics: handlers middleware, cache collector, loop lag watcher,
+    /metrics admin command and local Prometheus endpoint.
+
+    Args:
+        dp (Dispatcher): aiogram dispatcher.
+        cache_stats (Callable): cache stats provider, e.g. Brain.getCacheStats.
+        port (int): Prometheus endpoint port, every worker process needs own port.
+
+    Returns:
+        web.AppRunner: endpoint runner, call cleanup() on shutdown.
+    '''
+    dp.middleware.setup(MetricsMiddleware())
+    dp.register_message_handler(metricsCmd, commands=['metrics'])
+    collectCaches(cache_stats)
+    asyncio.get_event_loop().create_task(watchLoopLag())
+    return await startServer(port=port)
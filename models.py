@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - Brain domain models.
+#  Created by LulzLoL231 at 18/10/26
+#
+from datetime import datetime
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class Model:
+    '''Base of Brain models: frozen, slotted, parsed once from API dicts.
+
+    Read-only dict interface (`model['key']`, `in`, iteration, keys, get)
+    is kept for handlers written against raw dicts.
+    Unknown API keys are kept in `extra`, which is not compared nor hashed.
+    '''
+    __slots__ = ()
+    extra: Optional[Dict[str, Any]]
+
+    def _fieldValues(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, f.name) for f in fields(self) if f.name != 'extra')
+
+    def __eq__(self, other: Any) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._fieldValues() == other._fieldValues()
+
+    def __hash__(self) -> int:
+        return hash(self._fieldValues())
+
+    def keys(self) -> List[str]:
+        keys = [f.name for f in fields(self) if f.name != 'extra']
+        if self.extra:
+            keys.extend(self.extra)
+        return keys
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __contains__(self, key: Any) -> bool:
+        if key != 'extra' and key in self.__dataclass_fields__:
+            return True
+        return self.extra is not None and key in self.extra
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            if key == 'extra':
+                raise AttributeError(key)
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            if self.extra is not None and key in self.extra:
+                return self.extra[key]
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    @classmethod
+    def fromDict(cls, data: Dict[str, Any], **overrides: Any) -> Any:
+        '''Parses API dict into model.
+
+        Args:
+            data (Dict[str, Any]): API dict.
+            **overrides: field values, which replace API values.
+
+        Returns:
+            Model: model instance.
+        '''
+        values = {}
+        extra = dict(data)
+        for field in fields(cls):
+            if field.name == 'extra':
+                continue
+            if field.name in overrides:
+                values[field.name] = overrides[field.name]
+                extra.pop(field.name, None)
+            else:
+                values[field.name] = cls._parse(field.name, extra.pop(field.name, None))
+        return cls(extra=extra or None, **values)
+
+    @staticmethod
+    def _parse(name: str, value: Any) -> Any:
+        if name == 'groups':
+            return tuple(value or ())
+        return value
+
+    def toDict(self) -> Dict[str, Any]:
+        '''Returns model as API dict.
+
+        Returns:
+            Dict[str, Any]: dict.
+        '''
+        data = {f.name: getattr(self, f.name) for f in fields(self) if f.name != 'extra'}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+@dataclass(frozen=True, eq=False)
+class User(Model):
+    '''Registered telegram user.
+    '''
+    __slots__ = ('id', 'username', 'level', 'groups', 'fetched', 'extra')
+    id: int
+    username: str
+    level: str
+    groups: Tuple[str, ...]
+    fetched: Optional[datetime]
+    extra: Optional[Dict[str, Any]]
+
+
+@dataclass(frozen=True, eq=False)
+class Device(Model):
+    '''Registered device.
+    '''
+    __slots__ = ('uuid', 'type', 'alias', 'hostname', 'status', 'platform_name',
+                 'has_proxy', 'has_vc', 'network_access', 'groups', 'code_version',
+                 'version', 'extra')
+    uuid: str
+    type: str
+    alias: str
+    hostname: str
+    status: str
+    platform_name: str
+    has_proxy: bool
+    has_vc: bool
+    network_access: str
+    groups: Tuple[str, ...]
+    code_version: Optional[str]
+    version: Optional[int]
+    extra: Optional[Dict[str, Any]]
+
+    @property
+    def name(self) -> str:
+        '''Device alias or hostname.
+        '''
+        return self.alias if self.alias else self.hostname
+
+
+@dataclass(frozen=True, eq=False)
+class Task(Model):
+    '''Device task.
+    '''
+    __slots__ = ('id', 'type', 'status', 'extra')
+    id: int
+    type: str
+    status: str
+    extra: Optional[Dict[str, Any]]
+
+
+@dataclass(frozen=True, eq=False)
+class Version(Model):
+    '''Brain server or client version.
+    '''
+    __slots__ = ('version', 'extra')
+    version: Optional[str]
+    extra: Optional[Dict[str, Any]]
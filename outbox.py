@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - outbound Telegram messages queue.
+#  Created by LulzLoL231 at 18/10/26
+#
+import asyncio
+from time import monotonic
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from aiogram.utils.exceptions import RetryAfter
+
+import config
+import metrics
+from log import getLogger
+from metrics import MeteredBot
+from cache import TTLCache
+
+
+Sender = Callable[[str, Optional[Dict], Optional[Dict]], Awaitable[Any]]
+# Bot API methods, which are sent through chat queues.
+QUEUED_METHODS = frozenset((
+    'sendMessage', 'sendPhoto', 'sendDocument', 'sendAudio', 'sendVideo',
+    'sendMediaGroup', 'sendLocation', 'sendContact', 'sendSticker',
+    'forwardMessage', 'copyMessage', 'deleteMessage',
+    'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup', 'editMessageMedia'
+))
+# Successive edits of one message with these methods are coalesced.
+EDIT_METHODS = frozenset((
+    'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup', 'editMessageMedia'
+))
+
+
+class TokenBucket:
+    '''Token bucket rate limiter.
+
+    Args:
+        rate (float): tokens per second.
+        capacity (float): max burst.
+    '''
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def getDelay(self) -> float:
+        '''Returns seconds until one token is available.
+
+        Returns:
+            float: delay, 0 if token is available now.
+        '''
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    async def acquire(self) -> None:
+        '''Waits for one token and takes it.
+        '''
+        delay = self.getDelay()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.getDelay()
+        self.take()
+
+
+class _Item:
+    __slots__ = ('method', 'data', 'files', 'futures', 'enqueued')
+
+    def __init__(self, method: str, data: Optional[Dict], files: Optional[Dict]) -> None:
+        self.method = method
+        self.data = data
+        self.files = files
+        self.futures: List[asyncio.Future] = []
+        self.enqueued = monotonic()
+
+
+class Outbox:
+    '''Delivers outbound messages through per-chat queues.
+
+    Every chat has own token bucket, all chats share global bucket.
+    Pending edits of one message are coalesced, so only the latest is sent.
+    Retry-after pauses only the chat, which got it.
+
+    Args:
+        send (Sender): coroutine, which sends Bot API request.
+    '''
+    def __init__(self, send: Sender,
+                 global_rate: float = config.OUTBOX_GLOBAL_RATE,
+                 chat_rate: float = config.OUTBOX_CHAT_RATE,
+                 chat_burst: float = config.OUTBOX_CHAT_BURST) -> None:
+        self.send = send
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.bucket = TokenBucket(global_rate, global_rate)
+        self._queues: Dict[Any, Deque[_Item]] = {}
+        # idle bucket is full again after chat_burst / chat_rate seconds
+        self._buckets = TTLCache('outbox_buckets', maxsize=config.OUTBOX_MAXCHATS,
+                                 ttl=chat_burst / chat_rate + 1)
+        self._edits: Dict[Tuple[Any, str, Any], _Item] = {}
+        self._workers: Dict[Any, asyncio.Task] = {}
+        metrics.registry.addCollector(self._collect)
+
+    @property
+    def depth(self) -> int:
+        '''Returns queued requests count.
+        '''
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _collect(self) -> None:
+        metrics.outbox_depth.set(self.depth)
+        metrics.outbox_chats.set(len(self._queues))
+
+    def submit(self, method: str, data: Optional[Dict] = None,
+               files: Optional[Dict] = None) -> asyncio.Future:
+        '''Queues Bot API request to its chat.
+
+        Args:
+            method (str): Bot API method.
+            data (Optional[Dict]): request data, must contain chat_id.
+            files (Optional[Dict]): request files.
+
+        Returns:
+            asyncio.Future: request result.
+        '''
+        chat = data['chat_id']
+        future = asyncio.get_event_loop().create_future()
+        edit_key = None
+        if method in EDIT_METHODS and data.get('message_id') is not None and not files:
+            edit_key = (chat, method, data['message_id'])
+            item = self._edits.get(edit_key)
+            if item is not None:
+                item.data = data
+                item.futures.append(future)
+                metrics.outbox_coalesced.inc(method=method)
+                return future
+        item = _Item(method, data, files)
+        item.futures.append(future)
+        if edit_key is not None:
+            self._edits[edit_key] = item
+        self._queues.setdefault(chat, deque()).append(item)
+        if chat not in self._workers:
+            self._workers[chat] = asyncio.get_event_loop().create_task(self._work(chat))
+        return future
+
+    async def _work(self, chat: Any) -> None:
+        log = getLogger('PCON Outbox', '_work')
+        queue = self._queues[chat]
+        bucket = self._buckets.get(chat) or TokenBucket(self.chat_rate, self.chat_burst)
+        try:
+            while queue:
+                await bucket.acquire()
+                await self.bucket.acquire()
+                item = queue[0]
+                if item.method in EDIT_METHODS:
+                    self._edits.pop((chat, item.method, item.data.get('message_id')), None)
+                try:
+                    result = await self.send(item.method, item.data, item.files)
+                except RetryAfter as e:
+                    metrics.outbox_retry_after.inc(method=item.method)
+                    log.warning('Retry after %s s for chat %s', e.timeout, chat)
+                    if item.method in EDIT_METHODS:
+                        edit_key = (chat, item.method, item.data.get('message_id'))
+                        newer = self._edits.get(edit_key)
+                        if newer is not None:
+                            queue.popleft()
+                            newer.futures.extend(item.futures)
+                        else:
+                            self._edits[edit_key] = item
+                    await asyncio.sleep(e.timeout)
+                    continue
+                except Exception as e:
+                    queue.popleft()
+                    for future in item.futures:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                queue.popleft()
+                metrics.outbox_delay.observe(monotonic() - item.enqueued, method=item.method)
+                for future in item.futures:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._buckets.set(chat, bucket)
+            self._workers.pop(chat, None)
+            if not queue:
+                self._queues.pop(chat, None)
+
+    async def close(self, timeout: float = config.OUTBOX_CLOSE_TIMEOUT) -> None:
+        '''Waits for queued requests to be sent.
+
+        Args:
+            timeout (float): max wait in seconds.
+        '''
+        workers = list(self._workers.values())
+        if workers:
+            await asyncio.wait(workers, timeout=timeout)
+
+
+class QueuedBot(MeteredBot):
+    '''Bot, which sends chat messages and edits through Outbox.
+    '''
+    _outbox: Optional[Outbox] = None
+
+    @property
+    def outbox(self) -> Outbox:
+        if self._outbox is None:
+            self._outbox = Outbox(self._sendNow)
+        return self._outbox
+
+    async def request(self, method: str, data: Optional[Dict] = None,
+                      files: Optional[Dict] = None, **kwargs: Any) -> Any:
+        if method in QUEUED_METHODS and data and data.get('chat_id') is not None:
+            return await self.outbox.submit(method, data, files)
+        return await super().request(method, data, files, **kwargs)
+
+    async def _sendNow(self, method: str, data: Optional[Dict] = None,
+                       files: Optional[Dict] = None) -> Any:
+        return await super().request(method, data, files)
@@ -5,12 +5,17 @@
 #
 from asyncio import get_event_loop
 
-from aiogram import Bot, Dispatcher
+from aiogram import Dispatcher
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 from aiogram.types import BotCommand
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 
 import config
+import access
 from brain_api import Brain
+from fsm_storage import SQLiteStorage
+from metrics import MeteredBot
+from outbox import QueuedBot
 
 
 cmds = [
@@ -19,7 +24,33 @@ cmds = [
     BotCommand('version', 'Show version')
 ]
 loop = get_event_loop()
-bot = Dispatcher(Bot(config.TOKEN, loop, parse_mode='HTML'), loop, storage=MemoryStorage())
+if config.FSM_STORAGE == 'sqlite':
+    storage = SQLiteStorage()
+else:
+    storage = MemoryStorage()
+if config.TELEGRAM_API_SERVER:
+    server = TelegramAPIServer.from_base(config.TELEGRAM_API_SERVER)
+else:
+    server = TELEGRAM_PRODUCTION
+BotClass = QueuedBot if config.OUTBOX_ENABLED else MeteredBot
+bot = Dispatcher(BotClass(config.TOKEN, loop, parse_mode='HTML', server=server), loop, storage=storage)
 brain = Brain()
+brain.invalidationHooks.append(access.index.invalidate)
 loop.run_until_complete(bot.bot.set_my_commands(cmds))
+
+
+def registerRouters(dp: Dispatcher) -> None:
+    '''Attaches text commands and compact callback data routers to dispatcher.
+
+    Call after handlers modules are imported, so their state handlers go first.
+
+    Args:
+        dp (Dispatcher): aiogram dispatcher.
+    '''
+    import commands
+    import callback_data as cbd
+    dp.register_message_handler(commands.router.dispatch, commands.router.filter)
+    dp.register_callback_query_handler(cbd.router.dispatch, cbd.router.filter)
+
+
 __version__ = '2.2.0'
@@ -3,46 +3,117 @@
 #  PcControl - Security funcs.
 #  Created by LulzLoL231 at 04/11/20
 #
-from typing import Optional, Union
+import hmac
+from hashlib import sha256
+from base64 import urlsafe_b64encode
+from typing import Optional
 from zlib import crc32
 
 from aiogram import types
 
 import config
-from log import getLogger
+from log import getLogger, RateSampler
 from runtime import brain
 from emojis import Emojis
+from cache import TTLCache
+from commands import getCommand
+from models import User
 
 
-async def getUser(msg: types.Message) -> Optional[Union[dict, None]]:
+SIGN_SIZE = 10
+_signer = hmac.new(config.SECRET.encode(), digestmod=sha256)
+_verified = TTLCache('verified_signs',
+                     maxsize=config.VERIFIED_SIGNS_MAXSIZE,
+                     ttl=config.VERIFIED_SIGNS_TTL)
+_access_sampler = RateSampler()
+
+
+async def getUser(msg: types.Message) -> Optional[User]:
     '''getUser: returns user, if registered.
 
     Args:
         msg (types.Message): Telegram message.
 
     Returns:
-        Optional[Union[dict, None]]: user dict or None.
+        Optional[User]: user or None.
     '''
     log = getLogger('PCON Security', 'getUser')
     user = await brain.getUser(msg.chat.id)
     if user:
-        log.info(f'Access granted for {msg.chat.mention} ({str(msg.chat.id)})')
+        count = _access_sampler.allow(msg.chat.id)
+        if count:
+            log.info('Access granted for %s (%s), %s times', msg.chat.mention, msg.chat.id, count)
         return user
+    elif not brain.available:
+        log.warning('Brain unavailable for %s (%s)', msg.chat.mention, msg.chat.id)
+        await msg.answer(f'{Emojis.warning} <code>Brain недоступен, попробуйте позже.</code>')
+        return None
     else:
-        log.warn(f'Access denied for {msg.chat.mention} ({str(msg.chat.id)})')
+        log.warn('Access denied for %s (%s)', msg.chat.mention, msg.chat.id)
         await msg.answer(f'{Emojis.access_denied} <code>В доступе отказано!</code>')
         return None
 
 
+def signBytes(payload: bytes) -> bytes:
+    '''Returns truncated HMAC-SHA256 of payload.
+
+    Keyed HMAC state is precomputed once and copied per call.
+
+    Args:
+        payload (bytes): payload.
+
+    Returns:
+        bytes: signature.
+    '''
+    signer = _signer.copy()
+    signer.update(payload)
+    return signer.digest()[:SIGN_SIZE]
+
+
+def verifyBytes(payload: bytes, sign: bytes) -> bool:
+    '''Checks payload signature in constant time.
+
+    Args:
+        payload (bytes): payload.
+        sign (bytes): signature.
+
+    Returns:
+        bool: True or False.
+    '''
+    return hmac.compare_digest(sign, signBytes(payload))
+
+
 def signData(data: str) -> str:
-    '''[REMOVED]
+    '''Returns signed data: "<data>.<sign>".
+
+    Args:
+        data (str): data.
+
+    Returns:
+        str: signed data.
     '''
-    return '[REMOVED]'
+    sign = urlsafe_b64encode(signBytes(data.encode())).decode().rstrip('=')
+    return f'{data}.{sign}'
 
 
 def verifySign(signed_data: str) -> bool:
-    '''[REMOVED]
+    '''Verifies signed data, recently verified data is not verified again.
+
+    Args:
+        signed_data (str): signed data.
+
+    Returns:
+        bool: True or False.
     '''
+    if _verified.get(signed_data, False):
+        return True
+    data, sep, sign = signed_data.rpartition('.')
+    if not sep:
+        return False
+    expected = urlsafe_b64encode(signBytes(data.encode())).decode().rstrip('=')
+    if hmac.compare_digest(sign, expected):
+        _verified.set(signed_data, True)
+        return True
     return False
 
 
@@ -56,20 +127,4 @@ def check_cmd(msg: types.Message, cmd: str) -> bool:
     Returns:
         bool: True or False.
     '''
-    log = getLogger('PCON Security', 'check_cmd')
-    log.info(f'Called with args: ("{msg.text}", {cmd})')
-    cmds = {
-        'help': ('помощь', 'хелп', 'хэлп'),
-        'hubs': ('хабы'),
-        'netstatus': ('статус сети', 'сеть'),
-        'devices': ('устройства'),
-        'version': ('ver', 'version', 'вер', 'версия'),
-        'users': ('usr', 'users', 'пользователи', 'юзеры')
-    }
-    res = msg.text.lower() in cmds[cmd]
-    if res:
-        log.info(f'"{msg.text}" is "{cmd}" command alias.')
-        return res
-    else:
-        log.warning(f'"{msg.text}" is not a "{cmd}" command alias.')
-        return res
+    return getCommand(msg.text) == cmd
@@ -3,11 +3,55 @@
 #  PcControl - startup script.
 #  Created by LulzLoL231 at 04/11/20
 #
+from aiogram import Dispatcher
 from aiogram.utils.executor import start_polling
 
-from runtime import bot
+import config
+import metrics
+from outbox import QueuedBot
+from debounce import debouncer
+from tracker import tracker
+from watcher import watcher
+from runtime import bot, brain, registerRouters
+from webhook import start_webhook
+from workers import Supervisor
 import cmds
+import fleet  # noqa: F401 registers bulk tasks handlers.
+import controls  # noqa: F401 registers device and user control handlers.
+
+
+async def on_startup(dp: Dispatcher) -> None:
+    '''Startup hook: starts Brain cache sweepers, fleet watcher and metrics.
+
+    Args:
+        dp (Dispatcher): aiogram dispatcher.
+    '''
+    brain.startSweepers()
+    watcher.start()
+    dp['metrics_runner'] = await metrics.setup(dp, brain.getCacheStats)
+
+
+async def on_shutdown(dp: Dispatcher) -> None:
+    '''Shutdown hook: sends debounced tasks and queued messages, stops tasks
+    tracker, fleet watcher and metrics endpoint, closes Brain connection pool.
+
+    Args:
+        dp (Dispatcher): aiogram dispatcher.
+    '''
+    await debouncer.flush()
+    await tracker.close()
+    await watcher.stop()
+    if isinstance(dp.bot, QueuedBot):
+        await dp.bot.outbox.close()
+    await dp['metrics_runner'].cleanup()
+    await brain.close()
 
 
 if __name__ == '__main__':
-    start_polling(bot)
+    registerRouters(bot)
+    if config.WORKERS > 0:
+        Supervisor(bot, config.WORKERS).run()
+    elif config.MODE == 'webhook':
+        start_webhook(bot, on_startup=on_startup, on_shutdown=on_shutdown)
+    else:
+        start_polling(bot, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - tests setup.
+#  Created by LulzLoL231 at 18/10/26
+#
+import os
+import sys
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - text commands router tests.
+#  Created by LulzLoL231 at 18/10/26
+#
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import commands
+
+
+ALIASES = [(cmd, name) for cmd, names in commands.TEXT_ALIASES.items() for name in names]
+
+
+@pytest.mark.parametrize('cmd,name', ALIASES)
+def test_every_alias(cmd: str, name: str) -> None:
+    for text in (name, name.upper(), f'  {name.title()} ', name.replace(' ', '   ')):
+        assert commands.getCommand(text) == cmd
+
+
+@pytest.mark.parametrize('text', [None, '', 'ха', 'бы', 'устройств', 'статус', 'help me', '/help'])
+def test_not_alias(text: str) -> None:
+    assert commands.getCommand(text) is None
+
+
+def test_aliases_are_unique() -> None:
+    assert len(commands.ALIASES) == len(ALIASES)
+
+
+def test_duplicate_alias(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setitem(commands.TEXT_ALIASES, 'clash', ('сеть',))
+    with pytest.raises(ValueError):
+        commands._buildAliases()
+
+
+def test_router() -> None:
+    router = commands.TextCommandRouter()
+    called = []
+
+    @router.register('devices')
+    async def devices(msg: SimpleNamespace) -> None:
+        called.append(msg.text)
+
+    with pytest.raises(KeyError):
+        router.register('unknown')
+    assert router.filter(SimpleNamespace(text='Устройства')) == {'text_cmd': 'devices'}
+    assert router.filter(SimpleNamespace(text='Помощь')) is False
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(router.dispatch(SimpleNamespace(text=' устройства ')))
+        assert not loop.run_until_complete(router.dispatch(SimpleNamespace(text='хабы')))
+    finally:
+        loop.close()
+    assert called == [' устройства ']
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - tasks completion tracker.
+#  Created by LulzLoL231 at 18/10/26
+#
+import asyncio
+from time import monotonic
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from aiogram import types
+
+import config
+import metrics
+from emojis import Emojis
+from log import getLogger
+from models import Task
+from runtime import brain
+
+
+GetTasks = Callable[[str], Awaitable[Optional[List[Task]]]]
+
+
+class TaskTracker:
+    '''Follows added tasks until device finishes them.
+
+    One poller per device requests all its tasks at once, no matter how many
+    tasks are tracked. Poll interval grows while nothing changes and drops
+    back after any task is finished. Poller stops when device has no tracked tasks.
+
+    Args:
+        get_tasks (GetTasks): Brain.getTasksForDevice.
+        finished_statuses (FrozenSet[str]): statuses of finished tasks.
+    '''
+    def __init__(self, get_tasks: GetTasks,
+                 finished_statuses: FrozenSet[str] = config.TRACKER_FINISHED_STATUSES,
+                 min_interval: float = config.TRACKER_MIN_INTERVAL,
+                 max_interval: float = config.TRACKER_MAX_INTERVAL,
+                 backoff: float = config.TRACKER_BACKOFF,
+                 timeout: float = config.TRACKER_TASK_TIMEOUT) -> None:
+        self.get_tasks = get_tasks
+        self.finished_statuses = finished_statuses
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self._pending: Dict[str, Dict[int, Tuple[float, asyncio.Future]]] = {}
+        self._pollers: Dict[str, asyncio.Task] = {}
+        metrics.registry.addCollector(self._collect)
+
+    def _collect(self) -> None:
+        metrics.tracker_tasks.set(sum(len(tasks) for tasks in self._pending.values()))
+        metrics.tracker_devices.set(len(self._pollers))
+
+    def track(self, device_uuid: str, task_id: int) -> asyncio.Future:
+        '''Registers task, starts device poller if needed.
+
+        Args:
+            device_uuid (str): Device UUID.
+            task_id (int): task ID from Brain.addTask.
+
+        Returns:
+            asyncio.Future: finished Task, or None if Brain dropped it from device tasks.
+                Fails with asyncio.TimeoutError after `timeout` seconds.
+        '''
+        tasks = self._pending.setdefault(device_uuid, {})
+        entry = tasks.get(task_id)
+        if entry is not None:
+            return entry[1]
+        future = asyncio.get_event_loop().create_future()
+        tasks[task_id] = (monotonic() + self.timeout, future)
+        if device_uuid not in self._pollers:
+            self._pollers[device_uuid] = asyncio.get_event_loop().create_task(
+                self._poll(device_uuid))
+        return future
+
+    async def _poll(self, device_uuid: str) -> None:
+        log = getLogger('PCON Tracker', '_poll')
+        interval = self.min_interval
+        try:
+            while self._pending.get(device_uuid):
+                await asyncio.sleep(interval)
+                metrics.tracker_polls.inc()
+                tasks = await self.get_tasks(device_uuid)
+                finished = 0 if tasks is None else self._resolve(device_uuid, tasks)
+                finished += self._expire(device_uuid)
+                if finished:
+                    interval = self.min_interval
+                else:
+                    interval = min(self.max_interval, interval * self.backoff)
+        except Exception as e:
+            log.error('Tasks polling error for %s: %s', device_uuid, e)
+            for _, future in self._pending.pop(device_uuid, {}).values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._pollers.pop(device_uuid, None)
+            if not self._pending.get(device_uuid):
+                self._pending.pop(device_uuid, None)
+
+    def _resolve(self, device_uuid: str, tasks: List[Task]) -> int:
+        pending = self._pending.get(device_uuid, {})
+        current = {task.id: task for task in tasks}
+        finished = 0
+        for task_id in list(pending):
+            task = current.get(task_id)
+            if task is not None and task.status not in self.finished_statuses:
+                continue
+            _, future = pending.pop(task_id)
+            if not future.done():
+                future.set_result(task)
+            finished += 1
+        return finished
+
+    def _expire(self, device_uuid: str) -> int:
+        pending = self._pending.get(device_uuid, {})
+        now = monotonic()
+        expired = [task_id for task_id, (deadline, _) in pending.items() if deadline <= now]
+        for task_id in expired:
+            _, future = pending.pop(task_id)
+            if not future.done():
+                future.set_exception(asyncio.TimeoutError())
+        return len(expired)
+
+    def follow(self, msg: types.Message, device_uuid: str, task_id: int,
+               action: str) -> asyncio.Task:
+        '''Edits message with task result, when task is finished.
+
+        Args:
+            msg (types.Message): message to edit, e.g. "task sent" answer.
+            device_uuid (str): Device UUID.
+            task_id (int): task ID.
+            action (str): task type, for message.
+
+        Returns:
+            asyncio.Task: background task.
+        '''
+        return asyncio.get_event_loop().create_task(
+            self._follow(msg, self.track(device_uuid, task_id), action))
+
+    async def _follow(self, msg: types.Message, future: asyncio.Future, action: str) -> None:
+        try:
+            task = await future
+        except asyncio.TimeoutError:
+            text = f'{Emojis.warning} <code>Задача "{action}": нет ответа от устройства.</code>'
+        except Exception:
+            text = f'{Emojis.warning} <code>Задача "{action}": статус неизвестен.</code>'
+        else:
+            status = task.status if task is not None else 'done'
+            text = f'{Emojis.ok} <code>Задача "{action}" завершена: {status}.</code>'
+        try:
+            await msg.edit_text(text)
+        except Exception as e:
+            getLogger('PCON Tracker', '_follow').warning('Message edit error: %s', e)
+
+    async def close(self) -> None:
+        '''Stops pollers.
+        '''
+        pollers = list(self._pollers.values())
+        for poller in pollers:
+            poller.cancel()
+        if pollers:
+            await asyncio.gather(*pollers, return_exceptions=True)
+
+
+tracker = TaskTracker(brain.getTasksForDevice)
@@ -4,12 +4,17 @@
 #  Created by LulzLoL231 at 04/11/20
 #
 import datetime
-from typing import Tuple
+from functools import lru_cache
+from typing import Iterator, List, Tuple
 
 from aiogram import types
 
-import security as sec
+import config
+import access
+import callback_data as cbd
+from cache import TTLCache
 from emojis import Emojis
+from models import User, Device
 
 
 def getDelLogKey() -> types.InlineKeyboardMarkup:
@@ -38,37 +43,77 @@ def getDateName(date: datetime.datetime) -> str:
     return date.strftime('%d %b %Y (%A)')
 
 
+EMOJI_DIGITS = (Emojis.zero, Emojis.one, Emojis.two, Emojis.three, Emojis.four,
+                Emojis.five, Emojis.six, Emojis.seven, Emojis.eight, Emojis.nine)
+
+
+@lru_cache(maxsize=config.ROW_CACHE_MAXSIZE)
 def getEmojiNumByInt(number: int) -> str:
-    '''Returns emoji number by integer.
+    '''Returns emoji number by integer, multi-digit numbers are supported.
 
     Args:
         number (int): number.
 
     Returns:
-        str: number emoji.
-    '''
-    if number == 0:
-        return Emojis.zero
-    elif number == 1:
-        return Emojis.one
-    elif number == 2:
-        return Emojis.two
-    elif number == 3:
-        return Emojis.three
-    elif number == 4:
-        return Emojis.four
-    elif number == 5:
-        return Emojis.five
-    elif number == 6:
-        return Emojis.six
-    elif number == 7:
-        return Emojis.seven
-    elif number == 8:
-        return Emojis.eight
-    elif number == 9:
-        return Emojis.nine
-    else:
+        str: number emoji or empty string for negative number.
+    '''
+    if number < 0:
         return ''
+    return ''.join(EMOJI_DIGITS[int(digit)] for digit in str(number))
+
+
+def getPagesCount(total: int, page_size: int) -> int:
+    '''Returns pages count for list, at least one page.
+
+    Args:
+        total (int): list length.
+        page_size (int): items per page.
+
+    Returns:
+        int: pages count.
+    '''
+    return max(1, -(-total // page_size))
+
+
+def getPageSlice(total: int, page: int, page_size: int) -> Tuple[int, int, int]:
+    '''Returns clamped page number and its items range.
+
+    Args:
+        total (int): list length.
+        page (int): requested page, from 0.
+        page_size (int): items per page.
+
+    Returns:
+        Tuple[int, int, int]: page, start index, stop index.
+    '''
+    page = min(max(page, 0), getPagesCount(total, page_size) - 1)
+    start = page * page_size
+    return (page, start, min(start + page_size, total))
+
+
+def getPageNavButtons(action: str, page: int, pages: int) -> List[types.InlineKeyboardButton]:
+    '''Returns prev/next page buttons.
+
+    Args:
+        action (str): page callback action, e.g. "devices_page".
+        page (int): current page, from 0.
+        pages (int): pages count.
+
+    Returns:
+        List[types.InlineKeyboardButton]: buttons, empty for single page.
+    '''
+    buttons = []
+    if page > 0:
+        buttons.append(types.InlineKeyboardButton(
+            f'{Emojis.back_page} {page}/{pages}',
+            callback_data=cbd.encode(action, str(page - 1))
+        ))
+    if page < pages - 1:
+        buttons.append(types.InlineKeyboardButton(
+            f'{page + 2}/{pages} {Emojis.next_page}',
+            callback_data=cbd.encode(action, str(page + 1))
+        ))
+    return buttons
 
 
 def getStatusEmojiByStatus(status: str) -> str:
@@ -88,79 +133,144 @@ def getStatusEmojiByStatus(status: str) -> str:
         return Emojis.warning
 
 
-def parseUsers(array: list) -> Tuple[str, types.InlineKeyboardMarkup]:
-    '''Returns message content with all users from array.
+USER_ROW = '{level}</b> <a href="tg://user?id={id}">{username}#{id}</a>\n'
+DEVICE_ROW = '{type} {name}</b> - {emoji} {status}.\n'
+OFFLINE_DEVICE_ROW = '{type} {name}</b> - {emoji} <code>{status}</code>.\n'
+_rows = TTLCache('rows', maxsize=config.ROW_CACHE_MAXSIZE, ttl=config.ROW_CACHE_TTL)
+
+
+def _renderUserRow(user: User) -> str:
+    key = ('user', user.id, user.level, user.username)
+    row = _rows.get(key)
+    if row is None:
+        row = USER_ROW.format(level=user.level.upper(), id=user.id,
+                              username=user.username)
+        _rows.set(key, row)
+    return row
+
+
+def _renderDeviceRow(device: Device) -> str:
+    key = ('device', device.uuid, device.version, device.status,
+           device.type, device.alias, device.hostname)
+    row = _rows.get(key)
+    if row is None:
+        temp = DEVICE_ROW if device.status.lower() == 'online' else OFFLINE_DEVICE_ROW
+        row = temp.format(type=device.type,
+                          name=device.name,
+                          emoji=getStatusEmojiByStatus(device.status),
+                          status=device.status)
+        _rows.set(key, row)
+    return row
+
+
+def iterUserRows(array: List[User], start: int, stop: int) -> Iterator[Tuple[str, str, User]]:
+    '''Renders users rows lazily, unchanged rows come from rows cache.
 
     Args:
         array (list): users array.
+        start (int): first user index.
+        stop (int): index after last user.
+
+    Yields:
+        Tuple[str, str, User]: emoji number, row text and user.
+    '''
+    for num in range(start, stop):
+        user = array[num]
+        emoji_num = getEmojiNumByInt(num)
+        yield (emoji_num, f'{emoji_num}: <b>{_renderUserRow(user)}', user)
+
+
+def parseUsers(array: list, page: int = 0,
+               page_size: int = config.LIST_PAGE_SIZE) -> Tuple[str, types.InlineKeyboardMarkup]:
+    '''Returns message content with one page of users from array.
+
+    Args:
+        array (list): users array.
+        page (int): page number, from 0.
+        page_size (int): users per page.
 
     Returns:
         tuple: message content and types.InlineKeyboardMarkup.
     '''
-    cnt = '      <code>Список пользователей:</code>\n'
-    usr_temp = '{num}: <b>{level}</b> <a href="tg://user?id={id}">{username}#{id}</a>'
-    sep = '\n'
+    pages = getPagesCount(len(array), page_size)
+    page, start, stop = getPageSlice(len(array), page, page_size)
+    cnt = ['      <code>Список пользователей ({}/{}):</code>\n'.format(page + 1, pages)]
     key = types.InlineKeyboardMarkup()
-    for num, user in enumerate(array):
-        emoji_num = getEmojiNumByInt(num)
-        cnt += usr_temp.format(num=emoji_num,
-                               level=user["level"].upper(),
-                               id=str(user["id"]),
-                               username=user["username"]) + sep
+    for emoji_num, row, user in iterUserRows(array, start, stop):
+        cnt.append(row)
         key.add(types.InlineKeyboardButton(
             emoji_num,
-            callback_data=sec.signData(f'usercontrol@{str(user["id"])}')
+            callback_data=cbd.encode('usercontrol', str(user.id))
         ))
-    return (cnt, key)
+    nav = getPageNavButtons('users_page', page, pages)
+    if nav:
+        key.row(*nav)
+    return (''.join(cnt), key)
 
 
-def parseUser(user: dict) -> str:
+def parseUser(user: User) -> str:
     '''Returns parsed user info for message.
 
     Args:
-        user (dict): user info.
+        user (User): user info.
 
     Returns:
         str: message content.
     '''
     cnt = '<b>{level}:</b> <a href="tg://user?id={id}">{username}#{id}</a>\n\n'
-    return cnt.format(level=user['level'].upper(), id=str(user['id']), username=user['username'])
+    return cnt.format(level=user.level.upper(), id=str(user.id), username=user.username)
+
+
+def iterDeviceRows(array: List[Device], start: int, stop: int) -> Iterator[Tuple[str, str, Device]]:
+    '''Renders devices rows lazily, unchanged rows come from rows cache.
+
+    Args:
+        array (list): devices array.
+        start (int): first device index.
+        stop (int): index after last device.
+
+    Yields:
+        Tuple[str, str, Device]: emoji number, row text and device.
+    '''
+    for num in range(start, stop):
+        device = array[num]
+        emoji_num = getEmojiNumByInt(num)
+        yield (emoji_num, f'{emoji_num}: <b>{_renderDeviceRow(device)}', device)
 
 
-def parseDevices(array: list) -> tuple:
-    '''Returns message content with all devices from array.
+def parseDevices(array: list, page: int = 0,
+                 page_size: int = config.LIST_PAGE_SIZE) -> tuple:
+    '''Returns message content with one page of devices from array.
 
     Args:
         array (list): devices array.
+        page (int): page number, from 0.
+        page_size (int): devices per page.
 
     Returns:
         tuple: message content with inline keyboard
     '''
-    cnt = '      <code>Список устройств:</code>\n'
-    dev_temp = '{}: <b>{} {}</b> - {} {}.'
-    offline_dev_temp = '{}: <b>{} {}</b> - {} <code>{}</code>.'
-    sep = '\n'
+    pages = getPagesCount(len(array), page_size)
+    page, start, stop = getPageSlice(len(array), page, page_size)
+    cnt = ['      <code>Список устройств ({}/{}):</code>\n'.format(page + 1, pages)]
     key = types.InlineKeyboardMarkup(3)
-    for num, device in enumerate(array):
-        emoji_num = getEmojiNumByInt(num)
+    for emoji_num, row, device in iterDeviceRows(array, start, stop):
+        cnt.append(row)
         key.insert(types.InlineKeyboardButton(
             emoji_num,
-            callback_data=sec.signData(f'control@{device["uuid"]}')
+            callback_data=cbd.encode('control', device.uuid)
         ))
-        if device['status'].lower() == 'online':
-            cnt += dev_temp.format(emoji_num, device["type"], device["alias"] if bool(
-                device["alias"]) else device["hostname"], getStatusEmojiByStatus(device["status"]), device['status']) + sep
-        else:
-            cnt += offline_dev_temp.format(emoji_num, device["type"], device["alias"] if bool(
-                device["alias"]) else device["hostname"], getStatusEmojiByStatus(device["status"]), device['status']) + sep
-    return (cnt, key)
+    nav = getPageNavButtons('devices_page', page, pages)
+    if nav:
+        key.row(*nav)
+    return (''.join(cnt), key)
 
 
-def parseDevice(device: dict, redline: bool = True) -> str:
+def parseDevice(device: Device, redline: bool = True) -> str:
     '''Returns message content with device info.
 
     Args:
-        device (dict): device dict.
+        device (Device): device.
         redline (bool): Insert red line in begining.
 
     Returns:
@@ -170,17 +280,41 @@ def parseDevice(device: dict, redline: bool = True) -> str:
         cnt = '      {} <b>{}: {}</b>\n'
     else:
         cnt = '{} <b>{}: {}</b>\n'
-    sep = '\n'
-    device = device['device']
-    cnt = cnt.format(
-        getStatusEmojiByStatus(device['status']),
-        device["type"],
-        device['alias'] if bool(device['alias']) else device['hostname']
-    )
+    cnt = [cnt.format(
+        getStatusEmojiByStatus(device.status),
+        device.type,
+        device.name
+    )]
     # [REMOVED]
-    if device['code_version']:
-        cnt += sep + f'<b>Версия LZSS:</b> <code>{device["code_version"]}</code>'
-    return cnt
+    if device.code_version:
+        cnt.append(f'\n<b>Версия LZSS:</b> <code>{device.code_version}</code>')
+    return ''.join(cnt)
+
+
+def parseBrainHealth(health: dict) -> str:
+    '''Returns message content with Brain circuit breaker state and counters.
+
+    Args:
+        health (dict): Brain health dict.
+
+    Returns:
+        str: message content.
+    '''
+    if health['state'] == 'closed':
+        emoji = Emojis.online
+    elif health['state'] == 'open':
+        emoji = Emojis.offline
+    else:
+        emoji = Emojis.warning
+    return ''.join((
+        '      {} <b>Brain: {}</b>\n\n'.format(emoji, health['state']),
+        '<b>Ошибки:</b> <code>{}%</code>\n'.format(int(health['failure_rate'] * 100)),
+        '<b>Срабатывания:</b> <code>{}</code>\n'.format(health['trips']),
+        '<b>Запросы:</b> <code>{}</code>\n'.format(health['requests']),
+        '<b>Повторы:</b> <code>{}</code>\n'.format(health['retries']),
+        '<b>Таймауты:</b> <code>{}</code>\n'.format(health['timeouts']),
+        '<b>Отклонено:</b> <code>{}</code>'.format(health['short_circuited'])
+    ))
 
 
 def getPlatformName(platform: str) -> str:
@@ -202,7 +336,7 @@ def getPlatformName(platform: str) -> str:
         return 'Unknown'
 
 
-def parseDevicesForUser(array: list, user_access: str) -> list:
+def parseDevicesForUser(array: List[Device], user_access: str) -> List[Device]:
     '''Parse devices array for user.
 
     Args:
@@ -212,29 +346,17 @@ def parseDevicesForUser(array: list, user_access: str) -> list:
     Returns:
         list: devices array.
     '''
-    devices = []
-    for dev in array:
-        if dev['network_access'] == user_access or user_access == 'admin':
-            devices.append(dev)
-    return devices
+    return access.index.filterDevices(array, user_access)
 
 
-def userInDeviceGroup(user: dict, device: dict) -> bool:
+def userInDeviceGroup(user: User, device: Device) -> bool:
     '''Checks if user have access to device by groups.
 
     Args:
-        user (dict): user info.
-        device (dict): device info.
+        user (User): user info.
+        device (Device): device info.
 
     Returns:
         bool: Boolean.
     '''
-    accessed = False
-    for dev_group in device['groups']:
-        if accessed:
-            break
-        for usr_group in user['groups']:
-            if accessed:
-                break
-            accessed = dev_group == usr_group
-    return accessed
+    return access.index.userInDeviceGroup(user, device)
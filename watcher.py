@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - fleet status watcher.
+#  Created by LulzLoL231 at 18/10/26
+#
+import os
+import json
+import fcntl
+import asyncio
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from aiogram import types
+
+import config
+import metrics
+import commands
+import security as sec
+from emojis import Emojis
+from log import getLogger
+from models import Device
+from runtime import bot, brain
+
+
+# Device state: (hash, status, code version, name).
+State = Tuple[int, str, Optional[str], str]
+
+
+def getState(device: Device) -> State:
+    '''Returns device state, which is compared between snapshots.
+
+    Args:
+        device (Device): device.
+
+    Returns:
+        State: state tuple.
+    '''
+    return (hash((device.status, device.code_version, device.version)),
+            device.status, device.code_version, device.name)
+
+
+class FleetWatcher:
+    '''Fetches fleet snapshot every `interval` seconds and pushes transitions
+    (online/offline, version changes, new and removed devices) to subscribed admins.
+
+    Alerts of one admin are batched into one digest message, sent
+    `digest_delay` seconds after the first alert.
+    '''
+    def __init__(self, interval: float = config.WATCHER_INTERVAL,
+                 digest_delay: float = config.WATCHER_DIGEST_DELAY,
+                 path: str = config.WATCHER_SUBSCRIBERS_PATH) -> None:
+        self.interval = interval
+        self.digest_delay = digest_delay
+        self.path = path
+        self._state: Dict[str, State] = {}
+        self._visible: Dict[int, Set[str]] = {}
+        self._snapshots: Dict[int, List[Device]] = {}
+        self._digests: Dict[int, List[str]] = {}
+        self._subscribers: Set[int] = set()
+        self._subscribers_mtime = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def getSubscribers(self) -> Set[int]:
+        '''Returns subscribed admins, file is reread only when changed,
+        so subscriptions made in other worker processes are seen.
+
+        Returns:
+            Set[int]: telegram ids.
+        '''
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return self._subscribers
+        if mtime != self._subscribers_mtime:
+            with open(self.path) as f:
+                self._subscribers = set(json.load(f))
+            self._subscribers_mtime = mtime
+        return self._subscribers
+
+    def toggle(self, id: int) -> bool:
+        '''Subscribes or unsubscribes admin.
+
+        File is replaced atomically, so other workers never read partial file,
+        and changed under lock file, so concurrent toggles are not lost.
+
+        Args:
+            id (int): telegram id.
+
+        Returns:
+            bool: True if admin is subscribed now.
+        '''
+        with open(f'{self.path}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # mtime may not change between quick writes, so file is always reread
+            self._subscribers_mtime = 0.0
+            subscribers = set(self.getSubscribers())
+            subscribed = id not in subscribers
+            if subscribed:
+                subscribers.add(id)
+            else:
+                subscribers.discard(id)
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(sorted(subscribers), f)
+            os.replace(tmp, self.path)
+            self._subscribers = subscribers
+            self._subscribers_mtime = os.stat(self.path).st_mtime
+        return subscribed
+
+    def diff(self, devices: Iterable[Device]) -> List[Tuple[str, str, str]]:
+        '''Compares snapshot with previous one, only changed devices are examined.
+
+        First snapshot only initializes state.
+
+        Args:
+            devices (Iterable[Device]): fleet snapshot.
+
+        Returns:
+            List[Tuple[str, str, str]]: (device UUID, transition kind, alert line).
+        '''
+        first = not self._state
+        current: Dict[str, State] = {}
+        changes = []
+        for device in devices:
+            state = getState(device)
+            current[device.uuid] = state
+            old = self._state.get(device.uuid)
+            if first or (old is not None and old[0] == state[0]):
+                continue
+            if old is None:
+                changes.append((device.uuid, 'new',
+                                f'{Emojis.ok} <b>{state[3]}</b>: новое устройство'))
+                continue
+            if old[1].lower() != state[1].lower():
+                emoji = Emojis.online if state[1].lower() == 'online' else Emojis.offline
+                changes.append((device.uuid, state[1].lower(),
+                                f'{emoji} <b>{state[3]}</b>: {old[1]} → {state[1]}'))
+            if old[2] != state[2]:
+                changes.append((device.uuid, 'version',
+                                f'{Emojis.switch} <b>{state[3]}</b>: версия {old[2]} → {state[2]}'))
+        if not first:
+            for uuid in self._state.keys() - current.keys():
+                changes.append((uuid, 'removed',
+                                f'{Emojis.cancel} <b>{self._state[uuid][3]}</b>: удалено'))
+        self._state = current
+        return changes
+
+    async def tick(self) -> None:
+        '''Fetches snapshot and queues alerts.
+        '''
+        subscribers = self.getSubscribers()
+        if not subscribers:
+            return
+        metrics.watcher_ticks.inc()
+        fleet: Dict[str, Device] = {}
+        visible: Dict[int, Set[str]] = {}
+        for admin in subscribers:
+            devices = await brain.getDevicesForUser(admin, fresh=True)
+            if devices is None:
+                # keep previous snapshot, so devices are not reported as removed
+                devices = self._snapshots.get(admin, [])
+            elif admin not in self._snapshots:
+                # devices of new subscriber are not news
+                for device in devices:
+                    self._state.setdefault(device.uuid, getState(device))
+            self._snapshots[admin] = devices
+            visible[admin] = {device.uuid for device in devices}
+            for device in devices:
+                fleet[device.uuid] = device
+        for admin in list(self._snapshots):
+            if admin not in subscribers:
+                self._snapshots.pop(admin)
+        previous, self._visible = self._visible, visible
+        for uuid, kind, line in self.diff(fleet.values()):
+            metrics.watcher_changes.inc(kind=kind)
+            for admin in subscribers:
+                if uuid in visible[admin] or uuid in previous.get(admin, ()):
+                    self._queue(admin, line)
+
+    def _queue(self, admin: int, line: str) -> None:
+        digest = self._digests.get(admin)
+        if digest is None:
+            digest = self._digests[admin] = []
+            asyncio.get_event_loop().call_later(self.digest_delay, self._fire, admin)
+        digest.append(line)
+
+    def _fire(self, admin: int) -> None:
+        asyncio.get_event_loop().create_task(self._send(admin))
+
+    async def _send(self, admin: int) -> None:
+        lines = self._digests.pop(admin, [])
+        if not lines:
+            return
+        cnt = ['      <code>Статус сети:</code>\n\n']
+        cnt.extend(f'{line}\n' for line in lines[:config.WATCHER_DIGEST_MAX_LINES])
+        if len(lines) > config.WATCHER_DIGEST_MAX_LINES:
+            cnt.append(f'\n<i>...и ещё {len(lines) - config.WATCHER_DIGEST_MAX_LINES}</i>')
+        try:
+            await bot.bot.send_message(admin, ''.join(cnt))
+        except Exception as e:
+            getLogger('PCON Watcher', '_send').error('Digest for %s error: %s', admin, e)
+
+    async def _run(self) -> None:
+        log = getLogger('PCON Watcher', '_run')
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                log.error('Fleet snapshot error: %s', e)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        '''Starts watcher loop. Call from running loop.
+        '''
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        '''Stops watcher loop and sends pending digests.
+        '''
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._digests:
+            await asyncio.gather(*(self._send(admin) for admin in list(self._digests)))
+
+
+watcher = FleetWatcher()
+
+
+@commands.router.register('watch')
+async def watchCmd(msg: types.Message) -> None:
+    '''Admin command: subscribes to fleet status alerts or unsubscribes.
+    '''
+    user = await sec.getUser(msg)
+    if not user or user.level != 'admin':
+        return
+    if watcher.toggle(user.id):
+        await msg.answer(f'{Emojis.horn} <code>Уведомления о статусе сети включены.</code>')
+    else:
+        await msg.answer(f'{Emojis.mute} <code>Уведомления о статусе сети выключены.</code>')
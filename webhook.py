@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - webhook updates ingestion.
+#  Created by LulzLoL231 at 18/10/26
+#
+import hmac
+import asyncio
+from typing import Awaitable, Callable, Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+
+import config
+from log import getLogger
+
+
+Hook = Callable[[Dispatcher], Awaitable[None]]
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    '''Serves Telegram updates from aiohttp web app.
+
+    Updates are acknowledged at once and processed in background,
+    at most `concurrency` updates at a time. Requests without webhook
+    secret token are rejected, so updates can't be forged.
+    '''
+    def __init__(self, dp: Dispatcher, concurrency: int = config.WEBHOOK_CONCURRENCY,
+                 on_startup: Optional[Hook] = None,
+                 on_shutdown: Optional[Hook] = None,
+                 secret: str = config.WEBHOOK_SECRET) -> None:
+        self.dp = dp
+        self.secret = secret
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self.app = web.Application()
+        self.app.router.add_post(config.WEBHOOK_PATH, self.handle)
+        self.app.on_startup.append(self._startup)
+        self.app.on_shutdown.append(self._shutdown)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        '''Accepts Telegram update.
+
+        Args:
+            request (web.Request): webhook request.
+
+        Returns:
+            web.Response: empty 200 response, 401 if secret token is wrong.
+        '''
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret):
+            getLogger('PCON Webhook', 'handle').warning(
+                'Request without valid secret token from %s', request.remote)
+            return web.Response(status=401)
+        try:
+            update = types.Update(**(await request.json()))
+        except Exception as e:
+            getLogger('PCON Webhook', 'handle').error('Bad update: %s', e)
+            return web.Response(status=400)
+        task = asyncio.get_event_loop().create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: types.Update) -> None:
+        async with self._semaphore:
+            try:
+                await self.dp.process_update(update)
+            except Exception as e:
+                getLogger('PCON Webhook', '_process').exception(
+                    'Update #%s processing error: %s', update.update_id, e)
+
+    async def _startup(self, app: web.Application) -> None:
+        log = getLogger('PCON Webhook', '_startup')
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+        await self.dp.bot.set_webhook(config.WEBHOOK_HOST + config.WEBHOOK_PATH,
+                                      secret_token=self.secret)
+        log.info('Webhook set, serving on %s:%s', config.WEBAPP_HOST, config.WEBAPP_PORT)
+        if self.on_startup is not None:
+            await self.on_startup(self.dp)
+
+    async def _shutdown(self, app: web.Application) -> None:
+        log = getLogger('PCON Webhook', '_shutdown')
+        await self.dp.bot.delete_webhook()
+        if self._tasks:
+            log.info('Waiting for %s updates...', len(self._tasks))
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.on_shutdown is not None:
+            await self.on_shutdown(self.dp)
+        await self.dp.storage.close()
+        await self.dp.storage.wait_closed()
+        session = await self.dp.bot.get_session()
+        await session.close()
+
+
+def start_webhook(dp: Dispatcher, on_startup: Optional[Hook] = None,
+                  on_shutdown: Optional[Hook] = None) -> None:
+    '''Runs webhook server until interrupted.
+
+    Args:
+        dp (Dispatcher): aiogram dispatcher.
+        on_startup (Optional[Hook]): startup hook.
+        on_shutdown (Optional[Hook]): shutdown hook.
+    '''
+    server = WebhookServer(dp, on_startup=on_startup, on_shutdown=on_shutdown)
+    web.run_app(server.app, host=config.WEBAPP_HOST, port=config.WEBAPP_PORT, loop=dp.loop)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+#
+#  PcControl - multi-worker runtime.
+#  Created by LulzLoL231 at 18/10/26
+#
+import signal
+import asyncio
+import multiprocessing
+from queue import Empty
+from time import monotonic
+from typing import Any, Dict, Hashable, List, Optional
+
+from aiogram import Bot, Dispatcher, types
+
+import config
+from log import getLogger
+
+
+def getShardKey(update: dict) -> int:
+    '''Returns chat ID used for sharding, so one chat is always handled by one worker.
+
+    Args:
+        update (dict): raw telegram update.
+
+    Returns:
+        int: shard key.
+    '''
+    for kind in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if kind in update:
+            return update[kind]['chat']['id']
+    if 'callback_query' in update:
+        query = update['callback_query']
+        if 'message' in query:
+            return query['message']['chat']['id']
+        return query['from']['id']
+    for value in update.values():
+        if isinstance(value, dict) and 'from' in value:
+            return value['from']['id']
+    return update['update_id']
+
+
+class Worker:
+    '''Worker process: processes updates of its shard on own event loop.
+
+    Updates of one chat are processed in order, different chats concurrently.
+    '''
+    def __init__(self, index: int, inbox: multiprocessing.Queue,
+                 outbox: multiprocessing.Queue) -> None:
+        self.index = index
+        self.inbox = inbox
+        self.outbox = outbox
+        self.processed = 0
+        self.busy = 0.0
+        self._chains: Dict[int, asyncio.Task] = {}
+
+    def run(self) -> None:
+        '''Runs worker until supervisor sends stop message.
+        '''
+        from runtime import bot, brain, loop, registerRouters
+        import cmds  # noqa: F401 registers handlers.
+        import fleet  # noqa: F401 registers bulk tasks handlers.
+        import controls  # noqa: F401 registers device and user control handlers.
+        import watcher  # noqa: F401 registers watch command handler.
+
+        registerRouters(bot)
+
+        brain.onInvalidate = self._publishInvalidation
+        loop.run_until_complete(self._main(bot, brain))
+
+    def _publishInvalidation(self, kind: str, key: Hashable) -> None:
+        self.outbox.put(('invalidate', self.index, kind, key))
+
+    async def _main(self, dp: Dispatcher, brain: Any) -> None:
+        import metrics
+        from debounce import debouncer
+        from tracker import tracker
+        from watcher import watcher
+        log = getLogger('PCON Worker', str(self.index))
+        loop = asyncio.get_event_loop()
+        Bot.set_current(dp.bot)
+        Dispatcher.set_current(dp)
+        brain.startSweepers()
+        # worker #i serves /metrics on METRICS_PORT + i
+        metrics_runner = await metrics.setup(dp, brain.getCacheStats,
+                                             port=config.METRICS_PORT + self.index)
+        if self.index == 0:
+            # one fleet watcher for all workers
+            watcher.start()
+        reporter = loop.create_task(self._report())
+        log.info('Worker started.')
+        while True:
+            msg = await loop.run_in_executor(None, self.inbox.get)
+            if msg is None:
+                break
+            if msg[0] == 'update':
+                self._dispatch(dp, msg[1], msg[2])
+            elif msg[0] == 'invalidate':
+                brain.applyInvalidation(msg[1], msg[2])
+        reporter.cancel()
+        if self._chains:
+            await asyncio.gather(*self._chains.values(), return_exceptions=True)
+        await debouncer.flush()
+        await tracker.close()
+        await watcher.stop()
+        if hasattr(dp.bot, 'outbox'):
+            await dp.bot.outbox.close()
+        await metrics_runner.cleanup()
+        await brain.close()
+        await dp.storage.close()
+        await dp.storage.wait_closed()
+        await (await dp.bot.get_session()).close()
+        log.info('Worker stopped.')
+
+    def _dispatch(self, dp: Dispatcher, chat: int, update: dict) -> None:
+        prev = self._chains.get(chat)
+        task = asyncio.get_event_loop().create_task(self._process(dp, prev, update))
+        self._chains[chat] = task
+        task.add_done_callback(
+            lambda t: self._chains.pop(chat) if self._chains.get(chat) is t else None)
+
+    async def _process(self, dp: Dispatcher, prev: Optional[asyncio.Task],
+                       update: dict) -> None:
+        if prev is not None:
+            await asyncio.wait([prev])
+        started = monotonic()
+        try:
+            await dp.process_update(types.Update(**update))
+        except Exception as e:
+            getLogger('PCON Worker', str(self.index)).exception(
+                'Update #%s processing error: %s', update["update_id"], e)
+        finally:
+            self.processed += 1
+            self.busy += monotonic() - started
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(config.WORKER_REPORT_INTERVAL)
+            self.outbox.put(('load', self.index, {
+                'processed': self.processed,
+                'chats': len(self._chains),
+                'busy': round(self.busy, 3)
+            }))
+
+
+def runWorker(index: int, inbox: multiprocessing.Queue,
+              outbox: multiprocessing.Queue) -> None:
+    '''Worker process entrypoint.
+
+    SIGINT is ignored: terminal Ctrl-C reaches whole process group, and worker
+    must not die before supervisor sends stop message, or pending FSM writes
+    and debounced taps are lost.
+
+    Args:
+        index (int): worker index.
+        inbox (multiprocessing.Queue): updates and invalidations from supervisor.
+        outbox (multiprocessing.Queue): invalidations and load reports to supervisor.
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    Worker(index, inbox, outbox).run()
+
+
+class Supervisor:
+    '''Polls telegram updates and shards them between worker processes by chat ID.
+
+    User/device cache invalidations are broadcast to every worker,
+    FSM state is shared through SQLite storage.
+    '''
+    def __init__(self, dp: Dispatcher, workers: int = config.WORKERS) -> None:
+        self.dp = dp
+        self.running = False
+        self.load: Dict[int, Dict[str, Any]] = {}
+        ctx = multiprocessing.get_context('spawn')
+        self.inboxes: List[multiprocessing.Queue] = [ctx.Queue() for _ in range(workers)]
+        self.outbox: multiprocessing.Queue = ctx.Queue()
+        self.processes = [
+            ctx.Process(target=runWorker, args=(i, inbox, self.outbox),
+                        name=f'pcon-worker-{i}', daemon=True)
+            for i, inbox in enumerate(self.inboxes)
+        ]
+
+    def route(self, update: dict) -> int:
+        '''Sends update to its shard worker.
+
+        Args:
+            update (dict): raw telegram update.
+
+        Returns:
+            int: worker index.
+        '''
+        chat = getShardKey(update)
+        index = chat % len(self.inboxes)
+        self.inboxes[index].put(('update', chat, update))
+        return index
+
+    def getLoad(self) -> Dict[int, Dict[str, Any]]:
+        '''Returns last load report of every worker.
+
+        Returns:
+            Dict[int, Dict[str, Any]]: load report by worker index.
+        '''
+        return dict(self.load)
+
+    async def _poll(self) -> None:
+        log = getLogger('PCON Supervisor', '_poll')
+        await self.dp.bot.delete_webhook()
+        offset = None
+        while self.running:
+            try:
+                updates = await self.dp.bot.get_updates(offset=offset, timeout=20)
+            except Exception as e:
+                log.error('Polling error: %s', e)
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                self.route(update.to_python())
+
+    def _collectOne(self) -> Optional[tuple]:
+        try:
+            return self.outbox.get(timeout=1)
+        except Empty:
+            return None
+
+    async def _collect(self) -> None:
+        log = getLogger('PCON Supervisor', '_collect')
+        loop = asyncio.get_event_loop()
+        while self.running:
+            msg = await loop.run_in_executor(None, self._collectOne)
+            if msg is None:
+                continue
+            if msg[0] == 'invalidate':
+                for index, inbox in enumerate(self.inboxes):
+                    if index != msg[1]:
+                        inbox.put(('invalidate', msg[2], msg[3]))
+            elif msg[0] == 'load':
+                self.load[msg[1]] = msg[2]
+                log.info('Worker #%s load: %s', msg[1], msg[2])
+
+    def run(self) -> None:
+        '''Starts workers and polls updates until interrupted.
+        '''
+        log = getLogger('PCON Supervisor', 'run')
+        for process in self.processes:
+            process.start()
+        log.info('Started %s workers.', len(self.processes))
+        self.running = True
+        loop = self.dp.loop
+        try:
+            loop.run_until_complete(asyncio.gather(self._poll(), self._collect()))
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            self.running = False
+            for inbox in self.inboxes:
+                inbox.put(None)
+            for process in self.processes:
+                process.join(config.WORKER_STOP_TIMEOUT)
+            log.info('Workers stopped.')